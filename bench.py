@@ -0,0 +1,313 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, here)
+
+defaultBaseline = os.path.join(here, "bench_baseline.json")
+
+startupScript = "c2k 10\nk2c 300\nhelp\n" # commands that should not pay for matplotlib, labellines or numpy
+
+def startupTimes(repeat=5):
+    '''
+    Wall times of `main.py -` running startupScript in a fresh interpreter, in s
+    '''
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(here, "main.py"), "-", "-l", os.devnull], input=startupScript, text=True, stdout=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return times
+
+def timeit(func, repeat=5, minTime=0.05):
+    '''
+    Best time of one call of func, in s. Fast calls are looped until a run lasts at least minTime.
+    '''
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= minTime or number >= 1e6:
+            break
+        number *= 10
+
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+def kernels():
+    '''
+    parametrization functions to time, as {name: function of an array (or scalar) of temperatures in K}
+    '''
+    import parametrization as p
+
+    return {
+        "gamma_vw": p.gamma_vw,
+        "gamma_iw": lambda T: p.gamma_iw(T, P=0.1),
+        "gamma_vi": p.gamma_vi,
+        "kappa": p.kappa,
+        "dKappa_dP": p.dKappa_dP,
+        "rho_w_P0": p.rho_w_P0,
+        "nu_w_P0": p.nu_w_P0,
+        "nu_i_P0": p.nu_i_P0,
+        "r_m": lambda T: p.r_m(T, 0.5),
+        "ln_p_i_P0": p.ln_p_i_P0,
+        "ln_p_w_P0": p.ln_p_w_P0,
+        "S_w2S_i_P0": lambda T: p.S_w2S_i_P0(T, 0.5),
+        "S_i2S_w_P0": lambda T: p.S_i2S_w_P0(T, 1.2),
+        "S_w_changeTemp": lambda T: p.S_w_changeTemp(T, 296.0, 0.5),
+        "Si2p": lambda T: p.Si2p(T, 1.2),
+        "p2Si": lambda T: p.p2Si(T, 100.0),
+        "T_F": lambda T: p.T_F(T), # T used as a pressure in Pa, same order of magnitude as frost-point pressures
+        "T_F_MurphyKoop2005": lambda T: p.T_F_MurphyKoop2005(T / 50), # ln_p around 5
+        "ln_p_MurphyKoop2005": p.ln_p_MurphyKoop2005,
+        "dewPoint_S_w": p.dewPoint_S_w,
+        "frostPoint_S_i": p.frostPoint_S_i,
+        "cos_theta_iw": p.cos_theta_iw,
+        "criticalOutOfPoresGrowthRadius": lambda T: p.criticalOutOfPoresGrowthRadius(T, 1.2),
+    }
+
+def benchKernels(sizes=(1000, 1000000), repeat=5):
+    import numpy as np
+
+    inputs = {"scalar": 250.0}
+    rng = np.random.default_rng(0)
+    for size in sizes:
+        inputs["{:.0e}".format(size)] = rng.uniform(235, 293, size)
+
+    results = {}
+    with np.errstate(all="ignore"):
+        for name, kernel in kernels().items():
+            for inputName, T in inputs.items():
+                results["kernel/{}/{}".format(name, inputName)] = timeit(lambda: kernel(T), repeat=repeat)
+    return results
+
+graphCommands = {
+    "iso_S_w": ["-s", "0.1", "-e", "0.9", "-n", "50"],
+    "iso_T_F": ["-n", "50"],
+    "RH": ["40"],
+    "ambiant_S_w": ["0.4"],
+    "vline": ["250"],
+    "field": ["r_crit", "-n", "1000", "-m", "1000"],
+}
+
+def benchGraphs(repeat=5):
+    '''
+    End-to-end graph commands on the Agg backend, split into compute (command run unlabeled), labels
+    (labeled minus unlabeled run) and draw (full canvas draw afterwards)
+    '''
+    os.environ["MPLBACKEND"] = "Agg"
+    import warnings
+    import matplotlib.pyplot as plt
+    import graphs
+
+    def run(command, args):
+        graph = graphs.S_iTGraph()
+        graph.fig.canvas.draw()
+        start = time.perf_counter()
+        getattr(graph, command)(args)
+        graph.placeLabels() # labels are otherwise placed at the next refresh
+        elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        graph.fig.canvas.draw()
+        drawn = time.perf_counter() - start
+        plt.close(graph.fig)
+        return elapsed, drawn
+
+    results = {}
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        for command, args in graphCommands.items():
+            unlabeled = min(run(command, args + ["-u"])[0] for _ in range(repeat))
+            labeled, draw = [min(times) for times in zip(*[run(command, args) for _ in range(repeat)])]
+            results["graph/{}/compute".format(command)] = unlabeled
+            results["graph/{}/labels".format(command)] = max(labeled - unlabeled, 0)
+            results["graph/{}/draw".format(command)] = draw
+    return results
+
+def benchService(clients=8, duration=2.0, size=10, address=None):
+    '''
+    Throughput and latency of the conversion service : clients threads send S_w2S_i_P0 requests of size values
+    each, as fast as they can, to a service started in a separate process. Results are in s, per conversion for
+    the throughput.
+    '''
+    import tempfile
+    import threading
+    import numpy as np
+    import service
+
+    if address is None:
+        address = os.path.join(tempfile.mkdtemp(), "bench.sock") if hasattr(socket, "AF_UNIX") else "127.0.0.1:8766"
+    server = subprocess.Popen([sys.executable, os.path.join(here, "service.py"), "-a", address], stdout=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 10
+        while True: # wait for the service to listen
+            try:
+                service.Client(address).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline or server.poll() is not None:
+                    raise RuntimeError("The conversion service did not start")
+                time.sleep(0.02)
+
+        rng = np.random.default_rng(0)
+        T, S_w = rng.uniform(235, 293, size), rng.uniform(0.1, 1, size)
+        latencies = [[] for _ in range(clients)]
+        start = threading.Barrier(clients + 1)
+
+        def work(latencies):
+            with service.Client(address) as client:
+                client.S_w2S_i_P0(T, S_w)
+                start.wait()
+                end = time.perf_counter() + duration
+                while True:
+                    sent = time.perf_counter()
+                    if sent > end:
+                        break
+                    client.S_w2S_i_P0(T, S_w)
+                    latencies.append(time.perf_counter() - sent)
+
+        threads = [threading.Thread(target=work, args=(latencies[i],)) for i in range(clients)]
+        for thread in threads:
+            thread.start()
+        with service.Client(address) as client:
+            before = client.stats()
+            start.wait()
+            began = time.perf_counter()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - began
+            after = client.stats()
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies = np.concatenate([np.asarray(times) for times in latencies])
+    requests = after["requests"] - before["requests"]
+    batches = max(after["batches"] - before["batches"], 1)
+    print("service : {} clients x {} values, {:.0f} requests/s, {:.0f} conversions/s, {:.1f} requests per batch".format(clients, size, latencies.size / elapsed, latencies.size * size / elapsed, requests / batches))
+    return {
+        "service/latency/p50": float(np.percentile(latencies, 50)),
+        "service/latency/p99": float(np.percentile(latencies, 99)),
+        "service/conversion": elapsed / (latencies.size * size),
+    }
+
+def metadata():
+    import matplotlib
+    import numpy as np
+
+    return {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "matplotlib": matplotlib.__version__,
+        "machine": platform.platform(),
+    }
+
+def compare(results, baseline, tolerance):
+    '''
+    Prints every benchmark against the baseline and returns the names slower than baseline * (1 + tolerance)
+    '''
+    regressions = []
+    for name, value in results.items():
+        reference = baseline.get(name)
+        if reference is None or reference <= 0:
+            print("{:<60} {:>12.3e}s".format(name, value))
+            continue
+        ratio = value / reference
+        flag = ""
+        if ratio > 1 + tolerance:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print("{:<60} {:>12.3e}s  x{:0.2f}{}".format(name, value, ratio, flag))
+    return regressions
+
+def runAll(args):
+    parser = argparse.ArgumentParser(prog="bench.py run", description="Time the parametrization kernels, the graph commands and startup, compared against a stored baseline")
+    parser.add_argument("-o", "--json", dest="json", default=None, help="Write the results to this JSON file")
+    parser.add_argument("-b", "--baseline", dest="baseline", default=defaultBaseline, help="Baseline JSON file (default: %(default)s)")
+    parser.add_argument("-s", "--save-baseline", dest="saveBaseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("-t", "--tolerance", dest="tolerance", type=float, default=0.25, help="Allowed slowdown against the baseline before failing (default: %(default)s)")
+    parser.add_argument("-k", "--select", dest="select", choices=["all", "kernels", "graphs", "startup", "service"], default="all", help="Benchmarks to run (default: %(default)s)")
+    parser.add_argument("-r", "--repeat", dest="repeat", type=int, default=5, help="Repetitions, the best one is kept (default: %(default)s)")
+    parser.add_argument("--backend", dest="backend", choices=["exact", "table"], default="exact", help="parametrization backend (default: %(default)s)")
+    parsedArgs = parser.parse_args(args)
+
+    import parametrization
+    parametrization.setBackend(parsedArgs.backend)
+
+    results = {}
+    if parsedArgs.select in ("all", "kernels"):
+        results.update(benchKernels(repeat=parsedArgs.repeat))
+    if parsedArgs.select in ("all", "graphs"):
+        results.update(benchGraphs(repeat=parsedArgs.repeat))
+    if parsedArgs.select in ("all", "startup"):
+        results["startup/main"] = min(startupTimes(parsedArgs.repeat))
+    if parsedArgs.select in ("all", "service"):
+        results.update(benchService())
+
+    report = {"meta": dict(metadata(), backend=parsedArgs.backend), "results": results}
+
+    baseline = {}
+    if os.path.exists(parsedArgs.baseline) and not parsedArgs.saveBaseline:
+        with open(parsedArgs.baseline) as f:
+            baseline = json.load(f)["results"]
+    regressions = compare(results, baseline, parsedArgs.tolerance)
+
+    if parsedArgs.json:
+        with open(parsedArgs.json, "w") as f:
+            json.dump(report, f, indent=1)
+    if parsedArgs.saveBaseline:
+        with open(parsedArgs.baseline, "w") as f:
+            json.dump(report, f, indent=1)
+        print("Baseline written to {}".format(parsedArgs.baseline))
+
+    if regressions:
+        print("{} benchmarks slower than baseline by more than {:.0%}".format(len(regressions), parsedArgs.tolerance))
+        return 1
+    return 0
+
+def serviceBench(args):
+    parser = argparse.ArgumentParser(prog="bench.py service", description="Throughput and latency of the conversion service (service.py) under concurrent clients")
+    parser.add_argument("-c", "--clients", dest="clients", type=int, default=8, help="Concurrent clients (default: %(default)s)")
+    parser.add_argument("-d", "--duration", dest="duration", type=float, default=2.0, help="Duration, in s (default: %(default)s)")
+    parser.add_argument("-n", "--size", dest="size", type=int, default=10, help="Values per request (default: %(default)s)")
+    parser.add_argument("-a", "--address", dest="address", default=None, help="Address of the service started for the benchmark (default: a temporary Unix socket)")
+    parsedArgs = parser.parse_args(args)
+
+    for name, value in benchService(parsedArgs.clients, parsedArgs.duration, parsedArgs.size, parsedArgs.address).items():
+        print("{:<60} {:>12.3e}s".format(name, value))
+    return 0
+
+def startup(args):
+    parser = argparse.ArgumentParser(prog="bench.py startup", description="Measure the cold start of main.py and fail above a budget")
+    parser.add_argument("-b", "--budget", dest="budget", type=float, default=0.25, help="Maximum median startup time, in s (default: %(default)s)")
+    parser.add_argument("-r", "--repeat", dest="repeat", type=int, default=5, help="Number of runs (default: %(default)s)")
+    parsedArgs = parser.parse_args(args)
+
+    times = startupTimes(parsedArgs.repeat)
+    median = statistics.median(times)
+    print("startup : median {:0.3f}s, min {:0.3f}s, budget {:0.3f}s".format(median, min(times), parsedArgs.budget))
+    return 0 if median <= parsedArgs.budget else 1
+
+if __name__ == "__main__":
+    benchmarks = {"run": runAll, "startup": startup, "service": serviceBench}
+    if len(sys.argv) < 2 or sys.argv[1] not in benchmarks:
+        print("usage: bench.py {{{}}} [options]".format(",".join(benchmarks)))
+        sys.exit(2)
+    sys.exit(benchmarks[sys.argv[1]](sys.argv[2:]))
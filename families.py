@@ -0,0 +1,176 @@
+import matplotlib.colors as mcolors
+import matplotlib.patheffects as patheffects
+import matplotlib.text
+from matplotlib.collections import LineCollection
+import numpy as np
+
+class FamilyCollection(LineCollection):
+    '''
+    Curves sharing the same x values (an iso-line family), drawn as a single LineCollection.
+    The curves are the rows of the 2D array Y; members are hidden or removed through masks, and the
+    segments are only rebuilt at draw time when a mask changed.
+    '''
+    def __init__(self, x, Y, names, labels, **kwargs):
+        super().__init__([], label="_nolegend_", **kwargs)
+        self.x = np.asarray(x, dtype=float)
+        self.Y = np.atleast_2d(np.asarray(Y, dtype=float))
+        self.names = list(names)
+        self.labels = list(labels)
+
+        self.shown = np.ones(len(self.names), dtype=bool)
+        self.alive = np.ones(len(self.names), dtype=bool)
+        self.memberColors = np.resize(self.get_colors(), (len(self.names), 4))
+        self.memberWidths = np.resize(self.get_linewidths(), len(self.names)).astype(float)
+        self.members = [FamilyMember(self, i) for i in range(len(self.names))]
+
+        self._updateSegments()
+
+    def _updateSegments(self):
+        rows = np.flatnonzero(self.shown & self.alive)
+        segments = np.empty((rows.size, self.x.size, 2))
+        segments[:, :, 0] = self.x
+        segments[:, :, 1] = self.Y[rows]
+        self.set_segments(segments)
+        self.set_colors(self.memberColors[rows])
+        self.set_linewidths(self.memberWidths[rows])
+        self._segmentsStale = False
+
+    def _changed(self):
+        self._segmentsStale = True
+        self.stale = True
+
+    def setMemberVisible(self, i, value):
+        if self.shown[i] != value:
+            self.shown[i] = value
+            self._changed()
+
+    def setMemberColor(self, i, color):
+        self.memberColors[i] = mcolors.to_rgba(color)
+        self._changed()
+
+    def setMemberWidth(self, i, lw):
+        self.memberWidths[i] = lw
+        self._changed()
+
+    def removeMember(self, i):
+        self.alive[i] = False
+        self._changed()
+        if not self.alive.any() and self.axes is not None:
+            self.remove()
+
+    def restoreMember(self, ax, i):
+        '''
+        Brings back a removed member, re-adding the collection to ax if it had been removed with its last member
+        '''
+        self.alive[i] = True
+        self._changed()
+        if self.axes is None:
+            ax.add_collection(self, autolim=False)
+
+    def draw(self, renderer):
+        if self._segmentsStale:
+            self._updateSegments()
+        super().draw(renderer)
+
+class FamilyMember:
+    '''
+    One curve of a FamilyCollection, exposing the Line2D methods used by Graph and CLI
+    '''
+    def __init__(self, family, index):
+        self.family = family
+        self.index = index
+
+    def get_visible(self):
+        return bool(self.family.shown[self.index]) and self.family.get_visible()
+
+    def set_visible(self, value):
+        self.family.setMemberVisible(self.index, value)
+
+    def remove(self):
+        self.family.removeMember(self.index)
+
+    def get_xdata(self):
+        return self.family.x
+
+    def get_ydata(self):
+        return self.family.Y[self.index]
+
+    def get_label(self):
+        return self.family.labels[self.index]
+
+    def get_color(self):
+        return self.family.memberColors[self.index]
+
+    def set_color(self, color):
+        self.family.setMemberColor(self.index, color)
+
+    def get_linewidth(self):
+        return self.family.memberWidths[self.index]
+
+    def set_linewidth(self, lw):
+        self.family.setMemberWidth(self.index, lw)
+
+class FamilyLabel(matplotlib.text.Text):
+    '''
+    Label of a family member, drawn like labellines' LineLabel : the rotation follows the slope between
+    the two anchors in screen coordinates, so it stays aligned when the axes are zoomed or resized
+    '''
+    def __init__(self, x, y, text, anchor_a, anchor_b, align=True, outline_color=None, outline_width=5, **kwargs):
+        self._anchor_a = anchor_a
+        self._anchor_b = anchor_b
+        self._auto_align = align
+
+        kwargs.setdefault("clip_on", True)
+        kwargs.setdefault("zorder", 2.5)
+        kwargs.setdefault("horizontalalignment", "center")
+        kwargs.setdefault("verticalalignment", "center")
+        super().__init__(x, y, text, rotation_mode="anchor", **kwargs)
+
+        if outline_color is not None:
+            self.set_path_effects([patheffects.Stroke(linewidth=outline_width, foreground=outline_color), patheffects.Normal()])
+
+    def get_rotation(self):
+        if not self._auto_align or self.axes is None:
+            return super().get_rotation()
+
+        (xa, ya), (xb, yb) = self.axes.transData.transform([self._anchor_a, self._anchor_b])
+        angle = np.rad2deg(np.arctan2(yb - ya, xb - xa))
+        return (angle + 90) % 180 - 90
+
+def labelFamily(ax, family, xvals=None, align=True, shrink_factor=0.05):
+    '''
+    Places the labels of every alive member of family in one vectorized pass.
+    Returns {name: Text}; members without a finite value at their label position are left out.
+    '''
+    rows = np.flatnonzero(family.alive)
+    x = family.x
+    xmin, xmax = np.nanmin(x), np.nanmax(x)
+
+    if xvals is None: # spread labels across the axes like labellines does
+        low, high = ax.get_xlim()
+        shrinkage = (high - low) * shrink_factor
+        xv = np.linspace(low + shrinkage, high - shrinkage, rows.size + 2)[1:-1]
+    else:
+        xv = np.broadcast_to(np.asarray(xvals, dtype=float), rows.shape).copy()
+    xv[(xv < xmin) | (xv > xmax)] = xmin + (xmax - xmin) * 0.9
+
+    j = np.clip(np.searchsorted(x, xv), 1, x.size - 1)
+    xa, xb = x[j - 1], x[j]
+    ya, yb = family.Y[rows, j - 1], family.Y[rows, j]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        y = np.where(xb != xa, ya + (yb - ya) * (xv - xa) / (xb - xa), (ya + yb) / 2)
+
+    colors = family.memberColors
+    outline_color = ax.get_facecolor()
+    txts = {}
+    for k, row in enumerate(rows):
+        name = family.names[row]
+        if not np.isfinite(y[k]):
+            continue
+
+        txt = FamilyLabel(xv[k], y[k], family.labels[row], (xa[k], ya[k]), (xb[k], yb[k]), align=align, color=colors[row], outline_color=outline_color)
+        ax.add_artist(txt)
+        txt.set_clip_path(ax.patch)
+        txts[name] = txt
+
+    return txts
@@ -0,0 +1,121 @@
+from collections import namedtuple
+import matplotlib.artist
+import matplotlib.colors as mcolors
+import numpy as np
+
+import parametrization
+
+# A quantity of (T, S_i), split into terms depending on T only, computed once per temperature grid (1D arrays),
+# and the combination of those terms with ln(S_i), computed on every chunk of the grid.
+#   tTerms(T)            -> tuple of 1D arrays over T
+#   values(terms, lnS_i) -> values, terms are (1, nT) rows and lnS_i a (rows, 1) column
+#   domain(terms, lnS_i) -> boolean array, False where the quantity is not defined
+Quantity = namedtuple("Quantity", ["description", "unit", "scale", "tTerms", "values", "domain"])
+
+def _rCritTerms(T):
+    p = parametrization
+    return (4 * p.gamma_vi(T) * p.nu_i_P0(T) * p.cos_theta_iw(T) / (p.k_B * T),)
+
+def _r_mTerms(T):
+    p = parametrization
+    return (2 * p.gamma_vw(T) * p.nu_w_P0(T) / (p.k_B * T), p.saturationTerms(T).diff)
+
+quantities = {
+    # criticalOutOfPoresGrowthRadius, only defined over ice saturation
+    "r_crit": Quantity("Critical radius for ice growth out of pores", "nm", 1e9, _rCritTerms,
+                       lambda terms, lnS_i: terms[0] / lnS_i,
+                       lambda terms, lnS_i: lnS_i > 0),
+    # r_m with ln S_w = ln S_i - (ln_p_w - ln_p_i), negative (concave meniscus) and only kept below water saturation
+    "r_m": Quantity("Curvature radius of the meniscus (Kelvin equation)", "nm", 1e9, _r_mTerms,
+                    lambda terms, lnS_i: terms[0] / (lnS_i - terms[1]),
+                    lambda terms, lnS_i: lnS_i - terms[1] < 0),
+    "cos_theta_iw": Quantity("Cosine of the ice-water contact angle", "", 1, lambda T: (parametrization.cos_theta_iw(T),),
+                             lambda terms, lnS_i: np.broadcast_to(terms[0], (lnS_i.shape[0], terms[0].shape[1])),
+                             lambda terms, lnS_i: np.isfinite(lnS_i)),
+}
+
+def evaluate(quantity, T, S_i, chunkSize=2**20):
+    '''
+    quantity (a name of quantities or a Quantity) on the grid of S_i (rows) and T (columns), scaled to its unit.
+    Returns a masked array of shape (S_i.size, T.size), masked outside the domain of the quantity, where S_i <= 0
+    and on singularities. The grid is evaluated in chunks of about chunkSize points so that temporaries stay
+    bounded whatever the grid size, and without floating point warnings.
+    '''
+    quantity = quantities[quantity] if isinstance(quantity, str) else quantity
+    T = np.asarray(T, dtype=float).ravel()
+    S_i = np.asarray(S_i, dtype=float).ravel()
+
+    values = np.empty((S_i.size, T.size))
+    mask = np.empty((S_i.size, T.size), dtype=bool)
+    rows = max(1, chunkSize // max(T.size, 1))
+
+    with np.errstate(all="ignore"):
+        terms = [np.asarray(term, dtype=float).reshape(1, -1) for term in quantity.tTerms(T)]
+        lnS_i = np.log(S_i)
+        for start in range(0, S_i.size, rows):
+            ln = lnS_i[start:start + rows, None]
+            chunk = values[start:start + rows]
+            np.multiply(quantity.values(terms, ln), quantity.scale, out=chunk)
+            np.logical_not(quantity.domain(terms, ln) & np.isfinite(chunk) & np.isfinite(ln), out=mask[start:start + rows])
+
+    return np.ma.MaskedArray(values, mask)
+
+class ContourLabels(matplotlib.artist.Artist):
+    '''
+    The clabel texts of a ContourSet held as a single artist, so that they are removed, restored, hidden and
+    recolored along with the contours (ContourSet.remove drops its labels for good)
+    '''
+    def __init__(self, contours, **kwargs):
+        super().__init__()
+        texts = list(contours.clabel(**kwargs))
+        contours.labelTexts.clear()
+        for text in texts:
+            text.remove()
+        self._adopt(contours.axes, texts)
+
+    @classmethod
+    def fromTexts(cls, ax, texts):
+        '''
+        Contour labels made of already placed texts (not added to ax), e.g. restored from a snapshot
+        '''
+        labels = cls.__new__(cls)
+        matplotlib.artist.Artist.__init__(labels)
+        labels._adopt(ax, list(texts))
+        return labels
+
+    def _adopt(self, ax, texts):
+        self.texts = texts
+        for text in self.texts:
+            text.set_figure(ax.figure)
+            text.axes = ax
+        self.set_zorder(max([text.get_zorder() for text in self.texts], default=3))
+
+    def draw(self, renderer):
+        if not self.get_visible():
+            return
+        for text in self.texts:
+            text.draw(renderer)
+        self.stale = False
+
+    def get_color(self):
+        return self.texts[0].get_color() if self.texts else None
+
+    def set_color(self, color):
+        if np.ndim(color) == 2: # colors of a ContourSet, the labels take the first one
+            color = color[0] if len(color) else None
+        for text in self.texts:
+            text.set_color(color)
+        self.stale = True
+
+def labelFormat(unit):
+    return "%.3g " + unit if unit else "%.3g"
+
+def logNorm(values):
+    '''
+    LogNorm over the positive values of values, None if there are none
+    '''
+    positive = np.ma.compressed(values)
+    positive = positive[positive > 0]
+    if positive.size == 0:
+        return None
+    return mcolors.LogNorm(vmin=positive.min(), vmax=positive.max())
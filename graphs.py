@@ -1,12 +1,26 @@
 import matplotlib.pyplot as plt
-import matplotlib.text
 import matplotlib.colors as mcolors
-from labellines import labelLines
+from matplotlib.backends.backend_agg import FigureCanvasAgg, RendererAgg
+import matplotlib.text
+from labellines import labelLines as _labelLines
 import numpy as np
 from numpy._core.function_base import linspace as linspace
 import argparse
+from collections import OrderedDict, defaultdict
+import hashlib
+import os
 
 import parametrization
+from families import FamilyCollection, FamilyLabel, labelFamily as _labelFamily
+import fields
+import ingest
+from registry import ArtistRegistry, Entry
+import sampling
+import instrumentation
+from utils import parseArgs
+
+labelLines = instrumentation.timed("labels.labelLines")(_labelLines)
+labelFamily = instrumentation.timed("labels.labelFamily")(_labelFamily)
 
 class Graph:
     def __init__(self, title, x_label, y_label, Tn=np.linspace(235, 293, 100)):
@@ -17,60 +31,551 @@ class Graph:
 
         self.Tn = Tn
 
-        self.lines = {}
-        self.scatters = {}
-        self.txts = {}
+        self.artists = ArtistRegistry()
+        self.defaultTags = set() # tags given to every artist registered meanwhile (set by CLI.graph to the command name)
+
+        # Incremental redraw : lines, labels and scatters are animated artists, drawn over a cached background
+        # (axes without them) and blitted. _dirty holds artists to draw over the last frame, _repaint asks for
+        # all of them to be redrawn over the background (after a hide or a delete).
+        self.blit = self.fig.canvas.supports_blit
+        self._background = None
+        self._backgroundView = None
+        self._frame = None
+        self._dirty = []
+        self._repaint = False
+        self._saving = False
+        self.deferred = False # when True, refresh does nothing and the figure is only drawn when saved (batch mode)
+
+        # Live artists (watches) change in place at every frame : refreshOverlay draws them over a cached frame
+        # of the animated artists drawn below them (_underlay), so that a frame costs about the live artists alone.
+        self._overlay = []
+        self._underlay = None
+        self._underlayKey = None
+
+        # Labels cost far more to draw than curves (mathtext, outlines). On Agg canvases each label is rendered
+        # once per view into a sprite, blended into the canvas buffer by later redraws, so that repainting the
+        # animated artists after a hide or a delete costs about the curves alone.
+        self._sprites = {} # id(artist) : (artist, view, row, column, premultiplied rgba, 1 - alpha)
+        self._spriteRenderer = None
+        self.fig.canvas.mpl_connect("draw_event", self._onDraw)
+
+        # Labels are placed at the next refresh (or save) rather than when each line is plotted, so that a burst
+        # of commands places them in one pass. Placements of single lines are cached by curve data and options.
+        self.deferLabels = True
+        self.labelCacheSize = 4096
+        self._pendingLabels = [] # (name, artist, options)
+        self._labelCache = OrderedDict()
+
+    def register(self, name, artist, label=None, kind="line", family=None, tags=()):
+        '''
+        Registers an artist (and its label) under name, replacing any artist with the same name
+        '''
+        self.delete(name)
+        entry = Entry(name, artist, kind=kind, label=label, family=family, tags=self.defaultTags.union(tags))
+        self.artists.add(entry)
+        self._track(artist if kind != "member" else artist.family)
+        if label is not None:
+            self._track(label)
+        return entry
 
     def delete(self, name):
-        if name in self.lines.keys():
-            self.lines[name].remove()
-            del self.lines[name]
-        if name in self.txts.keys():
-            self.txts[name].remove()
-            del self.txts[name]
-
-    def plot(self, x, y, name, label="", color='b', lw=1, labelLine=True, align=True, xvals=None):
+        entry = self.artists.get(name)
+        if entry is None:
+            return
+
+        for artist in entry.artists():
+            artist.remove()
+        self.artists.remove(name)
+        self.artists.record("delete", entry)
+        self._repaint = True
+
+    def transaction(self):
+        '''
+        Groups bulk changes into a single undo step; callers refresh once afterwards
+        '''
+        return self.artists.transaction()
+
+    def deleteMany(self, names):
+        with self.transaction():
+            for name in names:
+                self.delete(name)
+
+    def set_visibility(self, name, value):
+        entry = self.artists.get(name)
+        if entry is None:
+            raise NameError("Line or scatter not found for changing visibility")
+
+        if entry.artist.get_visible() != value:
+            self.artists.record("visible", entry, not value)
+
+        for artist in entry.artists():
+            if artist.get_visible() == value:
+                continue
+            artist.set_visible(value)
+            if value and entry.kind != "member":
+                self._dirty.append(artist)
+            else: # hidden artists, and members of a family that is already drawn, need the background
+                self._repaint = True
+
+    def setVisible(self, names, value):
+        with self.transaction():
+            for name in names:
+                self.set_visibility(name, value)
+
+    def setColor(self, names, color):
+        with self.transaction():
+            for name in names:
+                entry = self.artists[name]
+                if entry.kind == "image": # colormapped
+                    continue
+                oldColor = entry.artist.get_facecolor() if entry.kind == "scatter" else entry.artist.get_edgecolor() if entry.kind == "contour" else entry.artist.get_color()
+                self.artists.record("color", entry, np.copy(oldColor) if isinstance(oldColor, np.ndarray) else oldColor)
+                entry.artist.set_color(color)
+                if entry.label is not None:
+                    entry.label.set_color(color)
+                self._repaint = True
+
+    def setWidth(self, names, lw):
+        with self.transaction():
+            for name in names:
+                entry = self.artists[name]
+                if entry.kind == "image":
+                    continue
+                self.artists.record("width", entry, np.copy(entry.artist.get_linewidth()))
+                entry.artist.set_linewidth(lw)
+                self._repaint = True
+
+    def undo(self):
+        '''
+        Reverts the last transaction. Returns False when there is nothing to undo.
+        '''
+        changes = self.artists.popUndo()
+        if changes is None:
+            return False
+
+        for action, entry, value in changes:
+            if action == "delete":
+                self._restore(entry)
+            elif entry.name not in self.artists or self.artists[entry.name] is not entry:
+                continue # the artist has been replaced or deleted since
+            elif action == "visible":
+                for artist in entry.artists():
+                    artist.set_visible(value)
+            elif action == "color":
+                entry.artist.set_color(value)
+                if entry.label is not None:
+                    entry.label.set_color(value)
+            elif action == "width":
+                entry.artist.set_linewidth(value)
+        self._repaint = True
+        return True
+
+    def _restore(self, entry):
+        self.delete(entry.name)
+        if entry.kind == "member":
+            entry.artist.family.restoreMember(self.ax, entry.artist.index)
+        elif entry.kind in ("scatter", "contour"):
+            self.ax.add_collection(entry.artist, autolim=False)
+        elif entry.kind == "image":
+            self.ax.add_image(entry.artist)
+        else:
+            self.ax.add_line(entry.artist)
+        if entry.label is not None:
+            self.ax.add_artist(entry.label)
+        self.artists.add(entry)
+
+    def invalidate(self):
+        '''
+        Redraws every animated artist at the next refresh, for artists whose data changed in place
+        '''
+        self._repaint = True
+
+    def addOverlay(self, *artists):
+        '''
+        Marks registered artists as live : their data changes in place and they are redrawn by refreshOverlay
+        '''
+        self._overlay.extend(artists)
+        self._underlay = None
+
+    @instrumentation.timed("Graph.refreshOverlay")
+    def refreshOverlay(self):
+        '''
+        Redraws the live artists after their data changed in place, with the animated artists drawn above them,
+        over the cached frame of the ones below. Other pending changes are drawn by refresh first.
+        '''
+        if self.deferred:
+            return
+        self._overlay = [artist for artist in self._overlay if artist.axes is not None] # deleted meanwhile
+        if not self.blit or not self._overlay:
+            self.invalidate()
+            self.refresh()
+            return
+
+        if self._pendingLabels or self._repaint or self._dirty or self._background is None or self._view() != self._backgroundView:
+            self.refresh()
+        if self._background is None: # the canvas was not drawn (hidden window)
+            return
+
+        canvas = self.fig.canvas
+        key = self._drawOrder()
+        first = min(key(artist) for artist in self._overlay)
+        artists = self._artists()
+        overlayKey = tuple(id(artist) for artist in self._overlay)
+        if self._underlay is None or self._underlayKey != overlayKey:
+            canvas.restore_region(self._background)
+            self._drawArtists([artist for artist in artists if key(artist) < first])
+            self._underlay = canvas.copy_from_bbox(self.ax.bbox)
+            self._underlayKey = overlayKey
+        else:
+            canvas.restore_region(self._underlay)
+        self._drawArtists([artist for artist in artists if key(artist) >= first])
+        canvas.blit(self.ax.bbox)
+        self._frame = canvas.copy_from_bbox(self.ax.bbox)
+        canvas.flush_events()
+
+    def _track(self, *artists):
+        '''
+        Registers newly created artists for incremental redraw
+        '''
+        for artist in artists:
+            artist.set_animated(self.blit)
+            self._dirty.append(artist)
+
+    def _artists(self):
+        artists = {}
+        for entry in self.artists:
+            for artist in entry.artists():
+                artist = getattr(artist, "family", artist) # family members are drawn by their collection
+                if artist.axes is not None:
+                    artists[id(artist)] = artist
+        return list(artists.values())
+
+    def _drawOrder(self):
+        '''
+        Sort key drawing artists in the order of a full draw : by zorder, then in the order they were added to ax
+        '''
+        order = {id(artist): i for i, artist in enumerate(self.ax.get_children())}
+        return lambda artist: (artist.get_zorder(), order.get(id(artist), -1))
+
+    def _drawArtists(self, artists):
+        view = self._view()
+        for artist in sorted(artists, key=self._drawOrder()):
+            if not artist.get_visible() or artist.axes is None:
+                continue
+            if isinstance(artist, (matplotlib.text.Text, fields.ContourLabels)) and isinstance(self.fig.canvas, FigureCanvasAgg):
+                self._blend(self._sprite(artist, view))
+            else:
+                self.ax.draw_artist(artist)
+
+    def _onTop(self, artists):
+        '''
+        True if artists are drawn above every other visible animated artist, so that they can be drawn over the last frame
+        '''
+        key = self._drawOrder()
+        ids = {id(artist) for artist in artists}
+        others = [key(artist) for artist in self._artists() if id(artist) not in ids and artist.get_visible()]
+        return not others or min(key(artist) for artist in artists) > max(others)
+
+    def _sprite(self, artist, view):
+        '''
+        Pixels of a label drawn alone, rendered again when the view changed or the label was modified (stale)
+        '''
+        sprite = self._sprites.get(id(artist))
+        if sprite is not None and sprite[0] is artist and sprite[1] == view and not artist.stale:
+            return sprite
+
+        width, height = self.fig.canvas.get_width_height(physical=True)
+        renderer = self._spriteRenderer
+        if renderer is None or (renderer.width, renderer.height, renderer.dpi) != (width, height, self.fig.dpi):
+            renderer = self._spriteRenderer = RendererAgg(width, height, self.fig.dpi)
+        renderer.clear()
+        artist.draw(renderer)
+
+        texts = artist.texts if isinstance(artist, fields.ContourLabels) else [artist]
+        extents = [text.get_window_extent(renderer) for text in texts if text.get_visible() and text.get_text()]
+        sprite = (artist, view, 0, 0, None, None)
+        if extents:
+            pad = int(np.ceil(4 * self.fig.dpi / 72)) + 2 # outline strokes and antialiasing
+            x0 = max(int(min(extent.x0 for extent in extents)) - pad, 0)
+            x1 = min(int(max(extent.x1 for extent in extents)) + pad, width)
+            y0 = max(int(height - max(extent.y1 for extent in extents)) - pad, 0) # buffer rows go downwards
+            y1 = min(int(height - min(extent.y0 for extent in extents)) + pad, height)
+            if x1 > x0 and y1 > y0:
+                pixels = np.asarray(renderer.buffer_rgba())[y0:y1, x0:x1].astype(np.float32) / 255
+                alpha = pixels[:, :, 3:]
+                premultiplied = np.concatenate([pixels[:, :, :3] * alpha, alpha], axis=2) * 255
+                sprite = (artist, view, y0, x0, premultiplied, 1 - alpha)
+        self._sprites[id(artist)] = sprite
+        return sprite
+
+    def _blend(self, sprite):
+        artist, view, row, column, premultiplied, transparency = sprite
+        if premultiplied is None:
+            return
+        buffer = np.asarray(self.fig.canvas.get_renderer().buffer_rgba())
+        region = buffer[row:row + premultiplied.shape[0], column:column + premultiplied.shape[1]]
+        region[...] = premultiplied + region * transparency + 0.5 # straight alpha "over", as Agg blends
+
+    def _view(self):
+        return (tuple(self.ax.get_xlim()), tuple(self.ax.get_ylim()), tuple(self.fig.bbox.bounds))
+
+    def _onDraw(self, event):
+        # Full draws (ours, window resizes, zoom, pan) rebuild the background and draw the animated artists on it
+        if self._saving or not self.blit or event is None or not hasattr(event.canvas, "copy_from_bbox"):
+            return
+        canvas = self.fig.canvas
+        self._background = canvas.copy_from_bbox(self.ax.bbox)
+        artists = self._artists()
+        live = {id(artist) for artist in artists}
+        self._sprites = {key: sprite for key, sprite in self._sprites.items() if key in live}
+        self._drawArtists(artists)
+        self._frame = canvas.copy_from_bbox(self.ax.bbox)
+        self._underlay = None
+        self._backgroundView = self._view()
+        self._dirty = []
+        self._repaint = False
+
+    def plot(self, x, y, name, label="", color='b', lw=1, labelLine=True, align=True, xvals=None, tags=()):
         self.delete(name)
-        self.lines[name] = self.ax.plot(x, y, label=label, color=color, lw=lw)[0]
+        line = self.ax.plot(x, y, label=label, color=color, lw=lw)[0]
+        self.register(name, line, tags=tags)
 
         if labelLine:
-            if xvals:
-                txts = labelLines([self.lines[name]], xvals=xvals, align=align)
-                if txts:
-                    self.txts[name] = txts[0]
-                else:
-                    self.txts[name] = matplotlib.text.Text()
+            self.requestLabel(name, line, xvals=xvals if xvals else None, align=align)
+
+    def requestLabel(self, name, artist, **options):
+        '''
+        Asks for the label of the artist registered under name, placed with labellines options (xvals, align,
+        yoffsets), or with labelFamily for the members of a FamilyCollection
+        '''
+        self._pendingLabels.append((name, artist, options))
+        if not self.deferLabels:
+            self.placeLabels()
+
+    def placeLabels(self):
+        '''
+        Places the pending labels : cached placements are reused, the other single lines are labeled with one
+        labelLines call per set of options and each family with one labelFamily call
+        '''
+        pending, self._pendingLabels = self._pendingLabels, []
+        lines = []
+        for name, artist, options in pending:
+            if isinstance(artist, FamilyCollection):
+                self._placeFamilyLabels(artist, options)
+                continue
+
+            entry = self.artists.get(name)
+            if entry is None or entry.artist is not artist: # deleted or replotted meanwhile
+                continue
+            if not artist.get_label() or artist.get_label().startswith("_"): # labelLines only labels legend entries
+                continue
+            if options.get("xvals") is None: # labelLines' default for a single line : middle of the axes
+                options = dict(options, xvals=sum(self.ax.get_xlim()) / 2)
+
+            key = self._labelKey(artist, options)
+            placement = self._labelCache.get(key)
+            if placement is not None:
+                self._labelCache.move_to_end(key)
+                self._attachLabel(entry, self._labelFromPlacement(artist, placement))
             else:
-                txts = labelLines([self.lines[name]], align=align)
-                if txts:
-                    self.txts[name] = txts[0]
-                else:
-                    self.txts[name] = matplotlib.text.Text()
-    
-    def scatter(self, x, y, name, label, marker="x", color="b"):
-        self.scatters[name] = self.ax.scatter(x, y, label=label, marker=marker, color=color)
+                lines.append((entry, options, key))
+
+        groups = defaultdict(list)
+        for entry, options, key in lines:
+            groups[(options.get("align", True), options.get("yoffsets", 0))].append((entry, options, key))
+
+        order = {id(line): i for i, line in enumerate(self.ax.lines)} # labelLines works in legend (axes) order
+        for (align, yoffsets), group in groups.items():
+            group.sort(key=lambda item: order[id(item[0].artist)])
+            txts = labelLines([entry.artist for entry, options, key in group], xvals=[options["xvals"] for entry, options, key in group], align=align, yoffsets=yoffsets)
+            byLine = {id(txt._line): txt for txt in txts or [] if txt is not None}
+            for entry, options, key in group:
+                txt = byLine.get(id(entry.artist))
+                if txt is None:
+                    continue
+                self._labelCache[key] = (tuple(txt.get_position()), tuple(txt._anchor_a), tuple(txt._anchor_b), txt._auto_align, txt.get_rotation(), txt.get_text())
+                self._attachLabel(entry, txt)
+
+        while len(self._labelCache) > self.labelCacheSize:
+            self._labelCache.popitem(last=False)
+
+    def _labelKey(self, line, options):
+        data = hashlib.blake2b(digest_size=16)
+        data.update(np.ascontiguousarray(line.get_xdata(), dtype=float).tobytes())
+        data.update(np.ascontiguousarray(line.get_ydata(), dtype=float).tobytes())
+        # lines not drawn in data coordinates (axvline : y in axes fraction) are placed according to the view
+        view = () if line.get_transform() == self.ax.transData else (self.ax.get_xlim(), self.ax.get_ylim())
+        return (data.digest(), line.get_label(), float(options["xvals"]), options.get("align", True), options.get("yoffsets", 0), view)
+
+    def _labelFromPlacement(self, line, placement):
+        position, anchor_a, anchor_b, align, rotation, text = placement
+        txt = FamilyLabel(*position, text, anchor_a, anchor_b, align=align, rotation=rotation, color=line.get_color(), outline_color=self.ax.get_facecolor())
+        self.ax.add_artist(txt)
+        txt.set_clip_path(self.ax.patch)
+        return txt
+
+    def _placeFamilyLabels(self, collection, options):
+        entries = [self.artists.get(name) for name in collection.names]
+        if not any(entry is not None and getattr(entry.artist, "family", None) is collection for entry in entries):
+            return
+        txts = labelFamily(self.ax, collection, **options)
+        for entry in entries:
+            if entry is not None and getattr(entry.artist, "family", None) is collection and entry.name in txts:
+                self._attachLabel(entry, txts[entry.name])
+        for name, txt in txts.items(): # members removed since
+            if txt.axes is not None and txt not in [entry.label for entry in entries if entry is not None]:
+                txt.remove()
+
+    def _attachLabel(self, entry, txt):
+        if entry.label is not None:
+            entry.label.remove()
+        entry.label = txt
+        txt.set_visible(entry.artist.get_visible())
+        if entry.kind != "member":
+            txt.set_color(entry.artist.get_color())
+        self._track(txt)
+
+    def plotFamily(self, x, Y, names, labels, color='b', lw=1, labelLine=True, align=True, xvals=None, family=None, tags=()):
+        '''
+        Plots the rows of Y against x as a single collection, each row registered under its own name
+        '''
+        rows = list({name: i for i, name in enumerate(names)}.values()) # a repeated name keeps its last curve, as with successive plot calls
+        names = [names[i] for i in rows]
+        labels = [labels[i] for i in rows]
+
+        for name in names:
+            self.delete(name)
+
+        collection = FamilyCollection(x, np.asarray(Y)[rows], names, labels, colors=color, linewidths=lw)
+        self.ax.add_collection(collection)
+        self.ax.autoscale_view()
+
+        for name, member in zip(names, collection.members):
+            self.register(name, member, kind="member", family=family, tags=tags)
 
-    def refresh(self):
-        self.fig.canvas.draw()
-        self.fig.canvas.flush_events()
+        if labelLine:
+            self.requestLabel(None, collection, xvals=xvals, align=align)
 
-    def set_visibility(self, name, value):
-        if name in self.lines.keys():
-            self.lines[name].set_visible(value)
-            self.txts[name].set_visible(value)
-        elif name in self.scatters.keys():
-            self.scatters[name].set_visible(value)
-            self.txts[name].set_visible(value)
+    @property
+    def terms(self):
+        '''
+        Saturation-pressure terms on Tn (see parametrization.saturationTerms), shared by every curve of the graph.
+        The cache is keyed on the content of Tn, so replacing or editing Tn never returns stale terms.
+        '''
+        return parametrization.saturationTerms(self.Tn)
+
+    def scatter(self, x, y, name, label, marker="x", color="b", tags=()):
+        self.delete(name)
+        self.register(name, self.ax.scatter(x, y, label=label, marker=marker, color=color), kind="scatter", tags=tags)
+
+    def plotTrajectory(self, trajectory, name, label="", color="k", lw=1, target=4000, tags=()):
+        '''
+        Draws an ingest.Trajectory, decimated to about target points of the current view and refined when zooming
+        '''
+        self.delete(name)
+        line = ingest.TrajectoryLine(trajectory, target=target, label=label, color=color, lw=lw)
+        self.ax.add_line(line)
+        self.ax.autoscale_view()
+        self.register(name, line, tags=tags)
+
+    def plotField(self, T, S_i, values, name, kind="contour", levels=None, cmap="viridis", norm=None, color=None, lw=1, labelLine=True, fmt="%.3g", tags=()):
+        '''
+        Draws values (masked array of shape (S_i.size, T.size), see fields.evaluate) as a contour layer or a heatmap
+        (kind "contour" or "image"). T and S_i must be evenly spaced for heatmaps. The view is left unchanged.
+        '''
+        self.delete(name)
+        xlim, ylim = self.ax.get_xlim(), self.ax.get_ylim()
+
+        label = None
+        if kind == "image":
+            artist = self.ax.imshow(values, extent=(T[0], T[-1], S_i[0], S_i[-1]), origin="lower", aspect="auto", interpolation="nearest", cmap=cmap, norm=norm, zorder=0.5)
         else:
-            raise NameError("Line or scatter not found for changing visibility")
+            artist = self.ax.contour(T, S_i, values, levels=levels, colors=color, cmap=None if color else cmap, norm=norm, linewidths=lw)
+            if labelLine:
+                label = fields.ContourLabels(artist, fmt=fmt, fontsize="small")
+                self.ax.add_artist(label)
+
+        self.ax.set_xlim(xlim)
+        self.ax.set_ylim(ylim)
+        self.register(name, artist, label=label, kind=kind, tags=tags)
+
+    @instrumentation.timed("Graph.refresh")
+    def refresh(self):
+        '''
+        Redraws the graph : only the changed artists are blitted when the view did not change since the last
+        full draw, otherwise the whole figure is redrawn
+        '''
+        if self.deferred:
+            return
+
+        if self._pendingLabels:
+            self.placeLabels()
+
+        canvas = self.fig.canvas
+        if not self.blit or self._background is None or self._view() != self._backgroundView:
+            canvas.draw()
+        elif self._repaint or self._dirty:
+            if not self._repaint and not self._onTop(self._dirty): # new artists below drawn ones (lines under labels)
+                self._repaint = True
+            if self._repaint:
+                canvas.restore_region(self._background)
+                self._drawArtists(self._artists())
+            else:
+                canvas.restore_region(self._frame)
+                self._drawArtists(self._dirty)
+            canvas.blit(self.ax.bbox)
+            self._frame = canvas.copy_from_bbox(self.ax.bbox)
+            self._underlay = None
+            self._dirty = []
+            self._repaint = False
+        canvas.flush_events()
+
+    @instrumentation.timed("Graph.savefig")
+    def savefig(self, fname, **kwargs):
+        '''
+        Saves the figure. Animated artists are skipped by matplotlib when saving, so they are drawn normally meanwhile.
+        '''
+        if self._pendingLabels:
+            self.placeLabels()
+
+        artists = self._artists()
+        self._saving = True
+        try:
+            for artist in artists:
+                artist.set_animated(False)
+            self.fig.savefig(fname, **kwargs)
+        finally:
+            for artist in artists:
+                artist.set_animated(self.blit)
+            self._saving = False
+            self._background = None # the figure has been redrawn without the background pass
+            self._sprites = {} # labels were drawn (no longer stale) without updating their sprites
 
 class S_iTGraph(Graph):
 
     def __init__(self, title="$S_i = f(T)$", x_label="$T (K)$", y_label="$S_i$", Tn=np.linspace(235, 293, 100)):
         super().__init__(title, x_label, y_label, Tn)
 
+    def Trange(self, args):
+        parser = argparse.ArgumentParser(prog="Trange", description="Set the temperature grid of the curves drawn afterwards", exit_on_error=False)
+        parser.add_argument("start", type=float, help="Lowest temperature, in K")
+        parser.add_argument("end", type=float, help="Highest temperature, in K")
+        parser.add_argument("-n", "--steps", dest="steps", type=int, default=100, help="Number of evenly spaced temperatures (default: %(default)s)")
+        parser.add_argument("-a", "--adaptive", dest="adaptive", action="store_true", help="Adaptive grid instead : temperatures gathered where the curves bend, within --tol (see sampling)")
+        parser.add_argument("-t", "--tol", dest="tol", type=float, default=1e-3, help="Relative tolerance of the adaptive grid, between the curves and their linear interpolation (default: %(default)s)")
+
+        parsedArgs = parseArgs(parser, args)
+        if parsedArgs is None:
+            return
+
+        start, end = sorted((parsedArgs.start, parsedArgs.end)) # labels are placed by searching ascending temperatures
+        if parsedArgs.adaptive:
+            self.Tn = sampling.diagramGrid(start, end, parsedArgs.tol)
+        else:
+            self.Tn = np.linspace(start, end, parsedArgs.steps)
+
     def S_w1(self, args):
-        S_in = [parametrization.S_w2S_i_P0(T, 1) for T in self.Tn]
+        S_in = self.terms.ratio
         self.plot(self.Tn, S_in, name="S_w1", label="$S_w = 1$", color="blue")
 
     def S_w(self, args): ### PAS FINI
@@ -81,12 +586,11 @@ class S_iTGraph(Graph):
         parser.add_argument("-u", "--unlabeled", dest="labeled", action="store_false", help="Unlabeled - when on, does not apply label to the line")
         parser.add_argument("-x", "--xvals", dest="xvals", type=float, default=270, help="xvals, decide where to put the label, alignment with respect to the x-axis (default: %(default)s)")
 
-        try: # prevents parser from exiting main program after displaying help
-            parsedArgs = parser.parse_args(args)
-        except SystemExit:
+        parsedArgs = parseArgs(parser, args)
+        if parsedArgs is None:
             return
         
-        S_in = [parametrization.S_w2S_i_P0(T, parsedArgs.S_w) for T in self.Tn]
+        S_in = parsedArgs.S_w * self.terms.ratio
         self.plot(self.Tn, S_in, labelLine=parsedArgs.labeled, name="S_w{:0.2f}".format(parsedArgs.S_w), label="$S_w$={:0.2f}".format(parsedArgs.S_w), color=parsedArgs.color, lw=parsedArgs.lw, xvals=parsedArgs.xvals)
 
     def S_i(self, args):
@@ -97,12 +601,11 @@ class S_iTGraph(Graph):
         parser.add_argument("-u", "--unlabeled", dest="labeled", action="store_false", help="Unlabeled - when on, does not apply label to the line")
         parser.add_argument("-x", "--xvals", dest="xvals", type=float, default=270, help="xvals, decide where to put the label, alignment with respect to the x-axis (default: %(default)s)")
 
-        try: # prevents parser from exiting main program after displaying help
-            parsedArgs = parser.parse_args(args)
-        except SystemExit:
+        parsedArgs = parseArgs(parser, args)
+        if parsedArgs is None:
             return
         
-        S_in = [parsedArgs.S_i] * self.Tn.size
+        S_in = np.full_like(self.Tn, parsedArgs.S_i, dtype=float)
         self.plot(self.Tn, S_in, labelLine=parsedArgs.labeled, name="S_i{:0.2f}".format(parsedArgs.S_i), label="$S_i$={:0.2f}".format(parsedArgs.S_i), color=parsedArgs.color, lw=parsedArgs.lw, xvals=parsedArgs.xvals)
 
     def iso_S_w(self, args):
@@ -115,15 +618,13 @@ class S_iTGraph(Graph):
         parser.add_argument("-u", "--unlabeled", dest="labeled", action="store_false", help="Unlabeled - when on, does not apply label to the line")
         parser.add_argument("-x", "--xvals", dest="xvals", type=float, default=270, help="xvals, decide where to put the label, alignment with respect to the x-axis (default: %(default)s)")
 
-        try: # prevents parser from exiting main program after displaying help
-            parsedArgs = parser.parse_args(args)
-        except SystemExit:
+        parsedArgs = parseArgs(parser, args)
+        if parsedArgs is None:
             return
 
         S_wn = np.linspace(parsedArgs.start, parsedArgs.end, parsedArgs.steps)
-        for S_w in S_wn:
-            S_in = parametrization.S_w2S_i_P0(self.Tn, S_w)
-            self.plot(self.Tn, S_in, labelLine=parsedArgs.labeled, name="S_w{:0.1f}".format(S_w), label="{:0.1f}".format(S_w), color=parsedArgs.color, xvals=parsedArgs.xvals, lw=parsedArgs.lw)
+        S_in = S_wn[:, None] * self.terms.ratio
+        self.plotFamily(self.Tn, S_in, labelLine=parsedArgs.labeled, names=["S_w{:0.1f}".format(S_w) for S_w in S_wn], labels=["{:0.1f}".format(S_w) for S_w in S_wn], color=parsedArgs.color, xvals=parsedArgs.xvals, lw=parsedArgs.lw, family="iso_S_w")
 
     def T_F(self, args):
         parser = argparse.ArgumentParser(prog="T_F", description="Draw a single T_F line", exit_on_error=False)
@@ -133,9 +634,8 @@ class S_iTGraph(Graph):
         parser.add_argument("-u", "--unlabeled", dest="labeled", action="store_false", help="Unlabeled - when on, does not apply label to the line")
         parser.add_argument("-x", "--xvals", dest="xvals", type=float, default=260, help="xvals, decide where to put the label, alignment with respect to the x-axis (default: %(default)s)")
 
-        try: # prevents parser from exiting main program after displaying help
-            parsedArgs = parser.parse_args(args)
-        except SystemExit:
+        parsedArgs = parseArgs(parser, args)
+        if parsedArgs is None:
             return
 
         S_in = self._T_F2S_in(self.Tn, parsedArgs.T_F)
@@ -151,16 +651,14 @@ class S_iTGraph(Graph):
         parser.add_argument("-u", "--unlabeled", dest="labeled", action="store_false", help="Unlabeled - when on, does not apply label to the line")
         parser.add_argument("-x", "--xvals", dest="xvals", type=float, default=260, help="xvals, decide where to put the label, alignment with respect to the x-axis (default: %(default)s)")
 
-        try: # prevents parser from exiting main program after displaying help
-            parsedArgs = parser.parse_args(args)
-        except SystemExit:
+        parsedArgs = parseArgs(parser, args)
+        if parsedArgs is None:
             return
 
         T_Fn = np.linspace(parsedArgs.start, parsedArgs.end, parsedArgs.steps)
 
-        for T_F in T_Fn:
-            S_in = self._T_F2S_in(self.Tn, T_F)
-            self.plot(self.Tn, S_in, labelLine=parsedArgs.labeled, name="T_F{:0.2f}".format(T_F), label="$T_F$={:0.2f}".format(T_F), color=parsedArgs.color, lw=parsedArgs.lw, xvals=parsedArgs.xvals)
+        S_in = self._T_F2S_in(self.Tn, T_Fn[:, None])
+        self.plotFamily(self.Tn, S_in, labelLine=parsedArgs.labeled, names=["T_F{:0.2f}".format(T_F) for T_F in T_Fn], labels=["$T_F$={:0.2f}".format(T_F) for T_F in T_Fn], color=parsedArgs.color, lw=parsedArgs.lw, xvals=parsedArgs.xvals, family="iso_T_F")
 
     def vline(self, args):
         parser = argparse.ArgumentParser(prog="vline", description="Draw a vertical line a givent temperature.")
@@ -170,19 +668,16 @@ class S_iTGraph(Graph):
         parser.add_argument("-u", "--unlabeled", dest="labeled", action="store_false", help="Unlabeled - when on, does not apply label to the line")
         parser.add_argument("-y", "--yoffsets", dest="yoff", type=float, default=1, help="yoffset, decide where to put the label, alignment with respect to the y-axis (default: %(default)s)")
 
-        try: # prevents parser from exiting main program after displaying help
-            parsedArgs = parser.parse_args(args)
-        except SystemExit:
+        parsedArgs = parseArgs(parser, args)
+        if parsedArgs is None:
             return
         
-        self.lines["V{:0.2}".format(parsedArgs.T)] = self.ax.axvline(parsedArgs.T, label="V{}".format(parsedArgs.T), color=parsedArgs.color, lw=parsedArgs.lw)
+        self.delete("V{:0.2}".format(parsedArgs.T))
+        line = self.ax.axvline(parsedArgs.T, label="V{}".format(parsedArgs.T), color=parsedArgs.color, lw=parsedArgs.lw)
+        self.register("V{:0.2}".format(parsedArgs.T), line)
 
         if parsedArgs.labeled:
-            txts = labelLines([self.lines["V{:0.2}".format(parsedArgs.T)]], yoffsets=parsedArgs.yoff, align=False)
-            if txts:
-                self.txts["V{:0.2}".format(parsedArgs.T)] = txts[0]
-            else:
-                self.txts["V{:0.2}".format(parsedArgs.T)] = matplotlib.text.Text()
+            self.requestLabel("V{:0.2}".format(parsedArgs.T), line, xvals=parsedArgs.T, yoffsets=parsedArgs.yoff, align=False)
         
     def ambiant_S_w(self, args):
         parser = argparse.ArgumentParser(prog="AmbiantS_w", description="Draw ambiant-S_w into real temperature S_i T diagram", exit_on_error=False)
@@ -193,12 +688,11 @@ class S_iTGraph(Graph):
         parser.add_argument("-u", "--unlabeled", dest="labeled", action="store_false", help="Unlabeled - when on, does not apply label to the line")
         parser.add_argument("-x", "--xvals", dest="xvals", type=float, default=270, help="xvals, decide where to put the label, alignment with respect to the x-axis (default: %(default)s)")
 
-        try: # prevents parser from exiting main program after displaying help
-            parsedArgs = parser.parse_args(args)
-        except SystemExit:
+        parsedArgs = parseArgs(parser, args)
+        if parsedArgs is None:
             return
 
-        S_in = np.array([parametrization.S_w2S_i_P0(T, parametrization.S_w_changeTemp(T, parsedArgs.ambiantT, parsedArgs.S_wT)) for T in self.Tn])
+        S_in = self._ambiantS_w2S_in(parsedArgs.ambiantT, parsedArgs.S_wT)
         self.plot(self.Tn, S_in, labelLine=parsedArgs.labeled, name="S_wT{:0.2f}".format(parsedArgs.S_wT), label="$S_wT${:0.2f}".format(parsedArgs.S_wT), color=parsedArgs.color, lw=parsedArgs.lw, xvals=parsedArgs.xvals)
 
     def RH(self, args):
@@ -210,16 +704,109 @@ class S_iTGraph(Graph):
         parser.add_argument("-u", "--unlabeled", dest="labeled", action="store_false", help="Unlabeled - when on, does not apply label to the line")
         parser.add_argument("-x", "--xvals", dest="xvals", type=float, default=270, help="xvals, decide where to put the label, alignment with respect to the x-axis (default: %(default)s)")
 
-        try: # prevents parser from exiting main program after displaying help
-            parsedArgs = parser.parse_args(args)
-        except SystemExit:
+        parsedArgs = parseArgs(parser, args)
+        if parsedArgs is None:
             return
 
-        S_in = np.array([parametrization.S_w2S_i_P0(T, parametrization.S_w_changeTemp(T, parsedArgs.ambiantT, parsedArgs.RHT / 100)) for T in self.Tn])
+        S_in = self._ambiantS_w2S_in(parsedArgs.ambiantT, parsedArgs.RHT / 100)
         self.plot(self.Tn, S_in, labelLine=parsedArgs.labeled, name="RHT{:0.2f}".format(parsedArgs.RHT), label="$RHT${:0.2f}".format(parsedArgs.RHT), color=parsedArgs.color, lw=parsedArgs.lw, xvals=parsedArgs.xvals)
 
+    def field(self, args):
+        parser = argparse.ArgumentParser(prog="field", exit_on_error=False, description="Map a quantity of (T, S_i) over the diagram, as contours or as a heatmap. Regions where the quantity is not defined are left blank.")
+        parser.add_argument("quantity", choices=fields.quantities.keys(), help="Quantity to map : " + ", ".join("{} ({})".format(name, quantity.description) for name, quantity in fields.quantities.items()))
+        parser.add_argument("-k", "--kind", dest="kind", choices=["contour", "heatmap"], default="contour", help="Layer kind (default: %(default)s)")
+        parser.add_argument("-s", "--start", dest="start", type=float, default=None, help="Lowest S_i of the grid (default: bottom of the axes)")
+        parser.add_argument("-e", "--end", dest="end", type=float, default=None, help="Highest S_i of the grid (default: top of the axes)")
+        parser.add_argument("-n", "--nT", dest="nT", type=int, default=500, help="Number of temperatures of the grid, over Trange (default: %(default)s)")
+        parser.add_argument("-m", "--nS", dest="nS", type=int, default=500, help="Number of S_i values of the grid (default: %(default)s)")
+        parser.add_argument("-l", "--levels", dest="levels", type=self._levels, default=None, help="Contour levels : a number of levels or comma-separated values, in the unit of the quantity (default: automatic)")
+        parser.add_argument("--log", dest="log", action="store_true", help="Logarithmic color scale and levels, over the absolute value of the quantity")
+        parser.add_argument("--cmap", dest="cmap", default="viridis", help="Colormap (default: %(default)s)")
+        parser.add_argument("-c", "--color", choices=dict(mcolors.BASE_COLORS, **mcolors.CSS4_COLORS).keys(), dest="color", default=None, help="Single color of the contours, instead of the colormap", metavar='matplotlibColor')
+        parser.add_argument("-w", "--lw", dest="lw", type=float, default=1, help="Contour line width (default: %(default)s)")
+        parser.add_argument("-u", "--unlabeled", dest="labeled", action="store_false", help="Unlabeled - when on, does not label the contours")
+
+        parsedArgs = parseArgs(parser, args)
+        if parsedArgs is None:
+            return
+
+        bottom, top = self.ax.get_ylim()
+        T = np.linspace(np.min(self.Tn), np.max(self.Tn), parsedArgs.nT)
+        S_i = np.linspace(bottom if parsedArgs.start is None else parsedArgs.start, top if parsedArgs.end is None else parsedArgs.end, parsedArgs.nS)
+
+        quantity = fields.quantities[parsedArgs.quantity]
+        values = fields.evaluate(quantity, T, S_i)
+        norm = None
+        if parsedArgs.log:
+            values = np.ma.abs(values)
+            norm = fields.logNorm(values)
+
+        kind = "image" if parsedArgs.kind == "heatmap" else "contour"
+        self.plotField(T, S_i, values, name="{}_{}".format(parsedArgs.quantity, parsedArgs.kind), kind=kind, levels=parsedArgs.levels, cmap=parsedArgs.cmap, norm=norm, color=parsedArgs.color, lw=parsedArgs.lw, labelLine=parsedArgs.labeled, fmt=fields.labelFormat(quantity.unit))
+
+    def trajectory(self, args):
+        parser = argparse.ArgumentParser(prog="trajectory", exit_on_error=False, description="Plot a measured T/RH log as a trajectory in the S_i T diagram. Logs are memory-mapped, CSV logs are converted once to a .npy file next to them.")
+        parser.add_argument("path", help="Log file : .csv with a header line, or .npy (structured, or 2D with --columns)")
+        parser.add_argument("-T", "--T-column", dest="T", default="T", help="Sample temperature column (default: %(default)s)")
+        parser.add_argument("-r", "--RH-column", dest="RH", default="RH", help="Relative humidity column (default: %(default)s)")
+        parser.add_argument("-s", "--sensor", dest="sensor", default=None, help="Column, or fixed temperature, at which RH is measured when it is not the sample temperature")
+        parser.add_argument("--celsius", dest="celsius", action="store_true", help="Temperatures are in degrees Celsius")
+        parser.add_argument("--fraction", dest="percent", action="store_false", help="RH is given between 0 and 1 instead of in percent")
+        parser.add_argument("--columns", dest="columns", type=lambda text: text.split(","), default=None, help="Comma-separated column names of an unstructured 2D .npy log")
+        parser.add_argument("-o", "--out", dest="out", default=None, help="Keep the computed S_i in this .npy file instead of in memory")
+        parser.add_argument("-n", "--points", dest="points", type=int, default=4000, help="Approximate number of points drawn for the current view (default: %(default)s)")
+        parser.add_argument("-c", "--color", choices=dict(mcolors.BASE_COLORS, **mcolors.CSS4_COLORS).keys(), dest="color", default="black", help="Color of the trajectory (default: %(default)s)", metavar='matplotlibColor')
+        parser.add_argument("-w", "--lw", dest="lw", type=float, default=1, help="Line width (default: %(default)s)")
+        parser.add_argument("--name", dest="name", default=None, help="Name of the trajectory (default: traj_ followed by the file name)")
+
+        parsedArgs = parseArgs(parser, args)
+        if parsedArgs is None:
+            return
+
+        sensor = parsedArgs.sensor
+        try:
+            sensor = float(sensor)
+        except (TypeError, ValueError):
+            pass
+
+        log = ingest.load(parsedArgs.path, names=parsedArgs.columns)
+        trajectory = ingest.toTrajectory(log, T=parsedArgs.T, RH=parsedArgs.RH, T_sensor=sensor, celsius=parsedArgs.celsius, percent=parsedArgs.percent, out=parsedArgs.out)
+        name = parsedArgs.name or "traj_" + os.path.splitext(os.path.basename(parsedArgs.path))[0]
+        self.plotTrajectory(trajectory, name=name, label=name, color=parsedArgs.color, lw=parsedArgs.lw, target=parsedArgs.points)
+
+    def pcf(self, args):
+        import simulation
+
+        parser = simulation.buildParser(prog="pcf", exit_on_error=False)
+        parser.add_argument("-c", "--color", choices=dict(mcolors.BASE_COLORS, **mcolors.CSS4_COLORS).keys(), dest="color", default="black", help="Color of the trajectory (default: %(default)s)", metavar='matplotlibColor')
+        parser.add_argument("-w", "--lw", dest="lw", type=float, default=1, help="Line width (default: %(default)s)")
+
+        parsedArgs = parseArgs(parser, args)
+        if parsedArgs is None:
+            return
+
+        result = simulation.run(parsedArgs)
+        onsets = lambda condition: np.flatnonzero(np.diff(condition.astype(np.int8), prepend=0) > 0)
+        frozen = onsets(np.diff(result.iceCount, prepend=0) > 0) # onsets of pore water freezing
+        active = onsets(result.active > 0) # onsets of ice growth out of pores
+
+        with self.transaction():
+            self.plot(result.T, result.S_i, name="pcf_path", label="PCF trajectory", color=parsedArgs.color, lw=parsedArgs.lw, labelLine=False)
+            self.scatter(result.T[frozen], result.S_i[frozen], name="pcf_frozen", label="pore freezing", marker="o", color="tab:blue")
+            self.scatter(result.T[active], result.S_i[active], name="pcf_active", label="ice growth out of pores", marker="*", color="tab:red")
+
+    @staticmethod
+    def _levels(text):
+        if "," in text:
+            return sorted(float(value) for value in text.split(","))
+        return int(text)
+
     def _T_F2S_in(self, Tn, T_F):
         ln_p = parametrization.ln_p_MurphyKoop2005(T_F)
-        S_i = np.exp(ln_p - parametrization.ln_p_i_P0(Tn))
+        S_i = np.exp(ln_p - parametrization.saturationTerms(Tn).ln_p_i)
+
+        return S_i
 
-        return S_i
\ No newline at end of file
+    def _ambiantS_w2S_in(self, ambiantT, S_wT):
+        # S_w_changeTemp followed by S_w2S_i_P0 : ln_p_w(T) cancels out
+        return S_wT * np.exp(parametrization.ln_p_w_P0(ambiantT) - self.terms.ln_p_i)
\ No newline at end of file
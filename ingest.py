@@ -0,0 +1,237 @@
+from itertools import islice
+import os
+
+import matplotlib.lines
+import numpy as np
+from numpy.lib.format import open_memmap
+
+import parametrization
+
+# Experimental T/RH logs are kept on disk as structured .npy files (one float field per column) and memory-mapped,
+# so that runs of millions of rows are never loaded at once. CSV logs are converted once, in chunks, to a .npy
+# file next to them. S_i is computed in chunks, and trajectories are drawn through TrajectoryLine, which only
+# hands the points of the current view, decimated to about the pixel resolution, to matplotlib.
+
+chunkRows = 2**20
+blockRows = 2**16 # rows per bounding box of Trajectory, used to skip the parts of a run outside the view
+
+def parseRows(lines, delimiter, width):
+    '''
+    Rows of the CSV lines as a (rows, width) float array, without the malformed lines (used by live.Tail too)
+    '''
+    try:
+        rows = np.loadtxt(lines, delimiter=delimiter, dtype=float, ndmin=2)
+        if rows.shape[1] == width or rows.shape[0] == 0:
+            return rows.reshape(-1, width)
+    except ValueError: # a malformed line : parse line by line and drop it
+        pass
+    rows = []
+    for line in lines:
+        try:
+            row = np.array(line.split(delimiter), dtype=float)
+        except ValueError:
+            continue
+        if row.size == width:
+            rows.append(row)
+    return np.array(rows).reshape(-1, width)
+
+def csvToNpy(csvPath, npyPath=None, delimiter=","):
+    '''
+    Converts a CSV log with a header line to a structured .npy file (one float64 field per column), chunk by
+    chunk, and returns its path. Malformed lines are skipped. An existing .npy newer than the CSV is reused : the
+    conversion is written to a temporary file, renamed only once complete.
+    '''
+    npyPath = os.path.splitext(csvPath)[0] + ".npy" if npyPath is None else npyPath
+    if os.path.exists(npyPath) and os.path.getmtime(npyPath) >= os.path.getmtime(csvPath):
+        return npyPath
+
+    with open(csvPath) as f:
+        names = [name.strip() for name in f.readline().split(delimiter)]
+        rows = sum(1 for line in f if line.strip())
+
+    dtype = np.dtype([(name, float) for name in names])
+    temporary = npyPath + ".part"
+    out = flat = None
+    try:
+        out = open_memmap(temporary, mode="w+", dtype=dtype, shape=(rows,))
+        flat = out.view(np.float64).reshape(rows, len(names))
+        with open(csvPath) as f:
+            f.readline()
+            position = 0
+            while True:
+                lines = list(islice(f, chunkRows))
+                if not lines:
+                    break
+                chunk = parseRows(lines, delimiter, len(names))
+                flat[position:position + len(chunk)] = chunk
+                position += len(chunk)
+        out.flush()
+        out = flat = None
+
+        if position < rows: # lines were skipped : copied to a file of the right length
+            full = np.load(temporary, mmap_mode="r")
+            out = open_memmap(npyPath + ".part2", mode="w+", dtype=dtype, shape=(position,))
+            for start in range(0, position, chunkRows):
+                stop = min(start + chunkRows, position)
+                out[start:stop] = full[start:stop]
+            out.flush()
+            out = full = None
+            os.replace(npyPath + ".part2", temporary)
+
+        os.replace(temporary, npyPath)
+    except BaseException:
+        out = flat = None # closes the memory maps before removing their files
+        for path in (temporary, npyPath + ".part2"):
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    return npyPath
+
+def load(path, names=None):
+    '''
+    Memory-mapped log : a structured array with one field per column. CSV files are converted first (csvToNpy).
+    Unstructured 2D .npy files are viewed as structured arrays with the given column names, without copying.
+    '''
+    if path.endswith(".csv"):
+        path = csvToNpy(path)
+    log = np.load(path, mmap_mode="r")
+    if log.dtype.names is None:
+        if names is None or log.ndim != 2 or log.shape[1] != len(names):
+            raise ValueError("{} has no column names, give one name per column".format(path))
+        log = log.view([(name, log.dtype) for name in names]).reshape(-1)
+    return log
+
+class Trajectory:
+    '''
+    A run as temperatures T (K) and ice saturations S_i, with the bounding box of every block of blockRows rows
+    '''
+    def __init__(self, T, S_i):
+        self.T = T
+        self.S_i = S_i
+
+        starts = np.arange(0, len(T), blockRows)
+        self.blockMin = np.empty((starts.size, 2))
+        self.blockMax = np.empty((starts.size, 2))
+        with np.errstate(invalid="ignore"):
+            for i, start in enumerate(starts):
+                for j, values in enumerate((T[start:start + blockRows], S_i[start:start + blockRows])):
+                    self.blockMin[i, j] = np.nanmin(values) if np.isfinite(values).any() else np.inf
+                    self.blockMax[i, j] = np.nanmax(values) if np.isfinite(values).any() else -np.inf
+
+    def __len__(self):
+        return len(self.T)
+
+def convert(T, RH, T_sensor=None, celsius=False, percent=True):
+    '''
+    Sample temperatures in K and S_i from temperatures T and relative humidities RH, measured at the sample
+    temperature or at T_sensor (temperatures or a single temperature) and then brought to the sample
+    temperature with S_w_changeTemp
+    '''
+    with np.errstate(all="ignore"):
+        T = np.asarray(T, dtype=float) + (273.15 if celsius else 0)
+        S_w = np.asarray(RH, dtype=float) / (100 if percent else 1)
+        if T_sensor is not None:
+            S_w = parametrization.S_w_changeTemp(T, np.asarray(T_sensor, dtype=float) + (273.15 if celsius else 0), S_w)
+        return T, parametrization.S_w2S_i_P0(T, S_w)
+
+def toTrajectory(log, T="T", RH="RH", T_sensor=None, celsius=False, percent=True, out=None):
+    '''
+    Streams the conversion of a log to a Trajectory (see convert). T_sensor is a column name or a temperature.
+    S_i is written to out (a .npy path, memory-mapped) or to memory.
+    '''
+    rows = len(log)
+    S_i = np.empty(rows) if out is None else open_memmap(out, mode="w+", dtype=float, shape=(rows,))
+    Tn = log[T] if not celsius else np.empty(rows)
+
+    for start in range(0, rows, chunkRows):
+        stop = min(start + chunkRows, rows)
+        sensor = log[T_sensor][start:stop] if isinstance(T_sensor, str) else T_sensor
+        T_chunk, S_i[start:stop] = convert(log[T][start:stop], log[RH][start:stop], sensor, celsius=celsius, percent=percent)
+        if celsius:
+            Tn[start:stop] = T_chunk
+
+    if out is not None:
+        S_i.flush()
+    return Trajectory(Tn, S_i)
+
+def _minmax(columns, bucket):
+    '''
+    Positions of the first, last, minimum and maximum values of the columns in each bucket of consecutive values
+    '''
+    size = columns[0].size
+    if bucket <= 1:
+        return np.arange(size)
+
+    buckets = -(-size // bucket)
+    positions = np.minimum(np.arange(buckets * bucket), size - 1).reshape(buckets, bucket) # last bucket padded
+    rows = np.arange(buckets)
+    kept = [positions[:, 0], positions[:, -1]]
+    for values in columns:
+        values = values[positions]
+        kept.append(positions[rows, np.where(np.isnan(values), np.inf, values).argmin(axis=1)])
+        kept.append(positions[rows, np.where(np.isnan(values), -np.inf, values).argmax(axis=1)])
+    return np.unique(np.concatenate(kept))
+
+def decimate(trajectory, xlim, ylim, target=4000):
+    '''
+    Points of trajectory to draw in the view xlim x ylim : every point when there are fewer than target visible
+    ones, otherwise the first, last, minimum and maximum T and S_i of consecutive buckets of visible points
+    (min/max decimation, which keeps the extremes of the curve). Points just outside the view are kept so that
+    lines reach the edges. Blocks outside the view are skipped and the others are read one at a time.
+    Returns (x, y) with NaN between the separate passes of the run through the view.
+    '''
+    (x0, x1), (y0, y1) = sorted(xlim), sorted(ylim)
+    blocks = np.flatnonzero((trajectory.blockMin[:, 0] <= x1) & (trajectory.blockMax[:, 0] >= x0) & (trajectory.blockMin[:, 1] <= y1) & (trajectory.blockMax[:, 1] >= y0))
+
+    masks = []
+    for block in blocks:
+        start = block * blockRows
+        x, y = trajectory.T[start:start + blockRows], trajectory.S_i[start:start + blockRows]
+        inView = (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)
+        inView[1:] |= inView[:-1].copy() # neighbours, for lines leaving or entering the view
+        inView[:-1] |= inView[1:].copy()
+        masks.append((start, inView))
+
+    total = sum(int(np.count_nonzero(inView)) for start, inView in masks)
+    bucket = 1 if total <= target else int(np.ceil(total / (target / 6))) # up to 6 points kept per bucket
+
+    kept, runs = [], []
+    run, last = 0, -2
+    for start, inView in masks:
+        visible = np.flatnonzero(inView)
+        if visible.size == 0:
+            continue
+        blockRuns = run + np.cumsum(np.diff(visible + start, prepend=last) > 1) # passes through the view
+        run, last = blockRuns[-1], visible[-1] + start
+
+        positions = _minmax([np.asarray(column[start:start + blockRows][visible], dtype=float) for column in (trajectory.T, trajectory.S_i)], bucket)
+        kept.append(visible[positions] + start)
+        runs.append(blockRuns[positions])
+
+    if not kept:
+        return np.empty(0), np.empty(0)
+    indices, runs = np.concatenate(kept), np.concatenate(runs)
+    breaks = np.flatnonzero(np.diff(runs) > 0) + 1
+    x = np.asarray(trajectory.T[indices], dtype=float)
+    y = np.asarray(trajectory.S_i[indices], dtype=float)
+    return np.insert(x, breaks, np.nan), np.insert(y, breaks, np.nan)
+
+class TrajectoryLine(matplotlib.lines.Line2D):
+    '''
+    Line drawing a Trajectory at the resolution of the current view : the data is decimated again at draw time
+    whenever the view changed (zoom, pan, resize)
+    '''
+    def __init__(self, trajectory, target=4000, **kwargs):
+        self.trajectory = trajectory
+        self.target = target
+        self._decimatedView = None
+        x, y = decimate(trajectory, (-np.inf, np.inf), (-np.inf, np.inf), target)
+        super().__init__(x, y, **kwargs)
+
+    def draw(self, renderer):
+        if self.axes is not None:
+            view = (tuple(self.axes.get_xlim()), tuple(self.axes.get_ylim()))
+            if view != self._decimatedView:
+                self._decimatedView = view
+                self.set_data(*decimate(self.trajectory, *view, target=self.target))
+        super().draw(renderer)
@@ -0,0 +1,75 @@
+from collections import defaultdict
+from contextlib import contextmanager
+import functools
+import inspect
+import time
+
+class Stats:
+    '''
+    Accumulated call counts and wall times, by name. Times are inclusive : a function calling other
+    instrumented functions also counts their time.
+    '''
+    def __init__(self):
+        self.counts = defaultdict(int)
+        self.times = defaultdict(float)
+
+    def add(self, name, elapsed):
+        self.counts[name] += 1
+        self.times[name] += elapsed
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def timed(self, name):
+        '''
+        Decorator accumulating the calls of a function under name
+        '''
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.add(name, time.perf_counter() - start)
+            wrapper.instrumented = True
+            return wrapper
+        return decorator
+
+    def reset(self):
+        self.counts.clear()
+        self.times.clear()
+
+    def report(self, prefix=""):
+        lines = ["{:<45} {:>9} {:>11} {:>11}".format("name", "calls", "total (s)", "mean (ms)")]
+        for name in sorted(self.times, key=self.times.get, reverse=True):
+            if name.startswith(prefix):
+                lines.append("{:<45} {:>9} {:>11.4f} {:>11.4f}".format(name, self.counts[name], self.times[name], 1e3 * self.times[name] / self.counts[name]))
+        return "\n".join(lines)
+
+stats = Stats()
+
+def timed(name):
+    return stats.timed(name)
+
+def timer(name):
+    return stats.timer(name)
+
+def instrumentModule(module, prefix=None, exclude=()):
+    '''
+    Replaces the public functions defined in module by instrumented wrappers. Calls made through the module
+    (module.func, or func from inside the module) are counted; names bound with "from module import func"
+    before this call are not. Idempotent.
+    '''
+    prefix = module.__name__ if prefix is None else prefix
+    for name, func in list(vars(module).items()):
+        if name.startswith("_") or name in exclude or not inspect.isfunction(func) or getattr(func, "instrumented", False):
+            continue
+        if func.__module__ != module.__name__:
+            continue
+        setattr(module, name, stats.timed("{}.{}".format(prefix, name))(func))
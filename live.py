@@ -0,0 +1,207 @@
+import os
+import queue
+import threading
+import time
+
+import matplotlib.lines
+import numpy as np
+
+import ingest
+
+# Live view of a growing log : a reader thread tails the file, parses and converts every new batch of lines,
+# and queues (T, S_i) arrays. The main thread drains the queue at the target frame rate (from a canvas timer, so
+# the prompt stays usable), appends the samples to a fixed-size ring buffer and redraws the trajectory over a
+# cached frame of the other artists (Graph.refreshOverlay). Neither the artists nor the figure are rebuilt for
+# new samples.
+
+class RingBuffer:
+    '''
+    The last capacity samples of (T, S_i)
+    '''
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.T = np.full(capacity, np.nan)
+        self.S_i = np.full(capacity, np.nan)
+        self.written = 0 # samples received since the start
+
+    def __len__(self):
+        return min(self.written, self.capacity)
+
+    def extend(self, T, S_i):
+        T, S_i = T[-self.capacity:], S_i[-self.capacity:]
+        index = (self.written + np.arange(T.size)) % self.capacity
+        self.T[index] = T
+        self.S_i[index] = S_i
+        self.written += T.size
+
+    def ordered(self):
+        '''
+        Samples from the oldest to the newest
+        '''
+        if self.written <= self.capacity:
+            return self.T[:self.written].copy(), self.S_i[:self.written].copy()
+        start = self.written % self.capacity
+        return np.roll(self.T, -start), np.roll(self.S_i, -start)
+
+    def last(self):
+        index = (self.written - 1) % self.capacity
+        return self.T[index], self.S_i[index]
+
+class Tail(threading.Thread):
+    '''
+    Reads the lines appended to a CSV log (with a header line) and queues them converted to (T, S_i) arrays.
+    Starts at the end of the file unless fromStart; a truncated or replaced file is read again from its start.
+    '''
+    def __init__(self, path, T="T", RH="RH", T_sensor=None, celsius=False, percent=True, fromStart=False, pollInterval=0.02, delimiter=","):
+        super().__init__(name="Tail " + path, daemon=True)
+        self.path = path
+        self.columns = (T, RH, T_sensor)
+        self.conversion = dict(celsius=celsius, percent=percent)
+        self.fromStart = fromStart
+        self.pollInterval = pollInterval
+        self.delimiter = delimiter
+
+        self.output = queue.SimpleQueue()
+        self.errors = queue.SimpleQueue()
+        self._stopping = threading.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    def _open(self, atEnd):
+        f = open(self.path, "rb")
+        names = [name.strip() for name in f.readline().decode().split(self.delimiter)]
+        T, RH, sensor = self.columns
+        missing = [column for column in (T, RH, sensor if isinstance(sensor, str) else None) if column is not None and column not in names]
+        if missing:
+            f.close()
+            raise ValueError("{} has no column {}".format(self.path, ", ".join(missing)))
+        self._indices = (names.index(T), names.index(RH), names.index(sensor) if isinstance(sensor, str) else None)
+        self._width = len(names)
+
+        partial = False
+        if atEnd:
+            end = f.seek(0, os.SEEK_END)
+            if end > 0:
+                f.seek(end - 1)
+                partial = f.read(1) != b"\n" # the last line is still being written : skip its end
+        return f, partial
+
+    def _parse(self, lines):
+        rows = ingest.parseRows(lines, self.delimiter, self._width)
+        if rows.shape[0] == 0:
+            return None
+
+        T, RH, sensor = self._indices
+        T_sensor = rows[:, sensor] if sensor is not None else self.columns[2]
+        return ingest.convert(rows[:, T], rows[:, RH], T_sensor, **self.conversion)
+
+    def run(self):
+        try:
+            f, partial = self._open(atEnd=not self.fromStart)
+        except Exception as e:
+            self.errors.put(e)
+            return
+
+        remainder = b""
+        try:
+            while not self._stopping.is_set():
+                data = f.read()
+                if not data:
+                    if os.path.getsize(self.path) < f.tell(): # truncated or replaced
+                        f.close()
+                        f, partial = self._open(atEnd=False)
+                        remainder = b""
+                    self._stopping.wait(self.pollInterval)
+                    continue
+
+                data = remainder + data
+                complete, _, remainder = data.rpartition(b"\n")
+                lines = [line for line in complete.decode(errors="replace").splitlines() if line.strip()]
+                if partial and lines:
+                    lines, partial = lines[1:], False
+                if lines:
+                    samples = self._parse(lines)
+                    if samples is not None:
+                        self.output.put(samples)
+        except Exception as e:
+            self.errors.put(e)
+        finally:
+            f.close()
+
+class Watcher:
+    '''
+    Draws the samples of a Tail on graph as a trajectory (the last capacity samples) with a marker on the
+    current state, registered under name. New samples are drawn at most fps times per second.
+    '''
+    def __init__(self, graph, tail, name, capacity=100000, fps=20, color="black", lw=1):
+        self.graph = graph
+        self.tail = tail
+        self.name = name
+        self.buffer = RingBuffer(capacity)
+        self.fps = fps
+        self.error = None
+
+        # above the curves and their labels, so that new samples are drawn over the cached frame alone
+        self.line = matplotlib.lines.Line2D([], [], color=color, lw=lw, label=name, zorder=3.5)
+        self.head = matplotlib.lines.Line2D([], [], color=color, marker="o", markersize=6, linestyle="none", zorder=3.5)
+        graph.ax.add_line(self.line)
+        graph.ax.add_line(self.head)
+        self.entry = graph.register(name, self.line, label=self.head)
+        graph.addOverlay(self.line, self.head)
+
+        self.timer = graph.fig.canvas.new_timer(interval=max(1, int(1000 / fps)))
+        self.timer.add_callback(self.update)
+
+    @property
+    def running(self):
+        return self.tail.is_alive()
+
+    def start(self, timer=True):
+        self.tail.start()
+        if timer:
+            self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+        self.tail.stop()
+
+    def update(self):
+        '''
+        Appends the queued samples and redraws. Returns the number of new samples.
+        '''
+        if self.graph.artists.get(self.name) is not self.entry: # deleted or replaced meanwhile
+            self.stop()
+            return 0
+        if not self.tail.errors.empty():
+            self.error = self.tail.errors.get()
+            self.stop()
+            return 0
+
+        batches = []
+        while True:
+            try:
+                batches.append(self.tail.output.get_nowait())
+            except queue.Empty:
+                break
+        if not batches:
+            return 0
+
+        T = np.concatenate([T for T, S_i in batches])
+        S_i = np.concatenate([S_i for T, S_i in batches])
+        self.buffer.extend(T, S_i)
+        self.line.set_data(*self.buffer.ordered())
+        self.head.set_data(*[[value] for value in self.buffer.last()])
+        self.graph.refreshOverlay()
+        return T.size
+
+    def run(self, duration):
+        '''
+        Watches for duration seconds without the canvas timer (scripts, or backends without an event loop)
+        '''
+        end = time.monotonic() + duration
+        while time.monotonic() < end and self.running:
+            time.sleep(min(1 / self.fps, max(end - time.monotonic(), 0)))
+            self.update()
+        time.sleep(self.tail.pollInterval) # lines written just before the end
+        self.update()
@@ -1,26 +1,66 @@
-import utils
-
-logger = utils.Logger("log.dat")
-CLI = utils.CLI(logger)
-
-while True:
-    userInput = input(">>> ")
-
-    command = userInput.split(" ")[0]
-    args = userInput.split(" ")[1:]
-    
-    if userInput == "exit":
-        break
-    elif userInput == "help" or userInput == "h" or userInput == "-h":
-        print("Available commands : ")
-        for method in [func for func in dir(CLI) if callable(getattr(CLI, func)) and not func.startswith("__")]:
-            print("\t{}".format(method))
-    elif command in dir(CLI):
-        try:
-            getattr(CLI, command)(args)
-        except Exception as e:
-            logger.log(str(e), 7)
+import argparse
+import os
+import sys
+
+parser = argparse.ArgumentParser(description="S_i T diagram command line. Without a script, runs the interactive prompt.")
+parser.add_argument("script", nargs="?", default=None, help="Command script to run without display, one command per line ('-' reads stdin)")
+parser.add_argument("-o", "--output", dest="outputs", action="append", default=[], help="Figure file written once the script is done, format given by the extension (png, svg, pdf...). Can be repeated.")
+parser.add_argument("-k", "--keep-going", dest="keepGoing", action="store_true", help="Run the remaining commands of the script after a failing one")
+parser.add_argument("-l", "--log", dest="logFile", default="log.dat", help="Log file (default: %(default)s)")
+parser.add_argument("--log-format", dest="logFormat", choices=["text", "jsonl"], default="text", help="Log file format (default: %(default)s)")
+parser.add_argument("--log-max-bytes", dest="logMaxBytes", type=int, default=10_000_000, help="Rotate the log file above this size, 0 to never rotate (default: %(default)s)")
+
+def main():
+    parsedArgs = parser.parse_args()
+
+    if parsedArgs.script is not None:
+        os.environ["MPLBACKEND"] = "Agg" # headless : no display needed. Set before matplotlib is (lazily) imported.
+
+    import utils
+
+    logger = utils.Logger(parsedArgs.logFile, logFormat=parsedArgs.logFormat, maxBytes=parsedArgs.logMaxBytes or None)
+
+    if parsedArgs.script is None:
+        CLI = utils.CLI(logger)
+
+        while True:
+            userInput = input(">>> ")
+
+            if userInput == "exit":
+                break
+
+            CLI.execute(userInput)
+
     else:
-        logger.log("User echo : " + userInput)
+        CLI = utils.CLI(logger, interactive=False)
+        status = 0
+
+        script = sys.stdin if parsedArgs.script == "-" else open(parsedArgs.script)
+        with script:
+            for lineNumber, userInput in enumerate(script, start=1):
+                userInput = userInput.strip()
+                if not userInput or userInput.startswith("#"):
+                    continue
+                if userInput == "exit":
+                    break
+
+                if not CLI.execute(userInput):
+                    logger.log("Command failed at line {} : {}".format(lineNumber, userInput), 7)
+                    status = 1
+                    if not parsedArgs.keepGoing:
+                        break
+
+        if status == 0 or parsedArgs.keepGoing:
+            for output in parsedArgs.outputs:
+                if not CLI.call("export", [output]): # not a command line : the path may hold spaces
+                    status = 1
+
+        logger.log("Exiting program.")
+        logger.close()
+        sys.exit(status)
+
+    logger.log("Exiting program.")
+    logger.close()
 
-logger.log("Exiting program.")
\ No newline at end of file
+if __name__ == "__main__": # importable by the worker processes of sweep, which start from a fresh interpreter
+    main()
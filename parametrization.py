@@ -1,6 +1,10 @@
-from scipy import constants
+from collections import OrderedDict, namedtuple
+import functools
 import numpy as np
 
+N_A = 6.02214076e23 # mol-1, Avogadro constant (exact since SI 2019, same value as scipy.constants.Avogadro)
+k_B = 1.380649e-23 # J/K, Boltzmann constant (exact since SI 2019, same value as scipy.constants.k)
+
 M_w = 18.01528e-3 # kg/m3 Molecular mass of water
 rho_ice = 916.7 # kg/m3, ice volumic mass
 
@@ -9,6 +13,120 @@ def check_float(*argv):
         if type(arg) != float:
             raise TypeError("Argument passed to parametrization module should be float")
 
+# Evaluation backends
+# "exact" evaluates the published formulas. "table" evaluates the @tabulated functions from piecewise cubics
+# fitted on Chebyshev nodes over [Tmin, Tmax] and evaluated in Horner form, which is faster than their
+# transcendental formulas on arrays. Python floats, temperatures outside the table range and non-finite ones
+# are evaluated with the exact formulas.
+backend = "exact"
+_exactFunctions = {} # name -> (exact function, error kind, segments, degree)
+_tables = {} # name -> _Table, filled by setBackend("table")
+
+class _Table:
+    def __init__(self, func, Tmin, Tmax, segments, degree, errorKind):
+        self.func = func
+        self.Tmin = float(Tmin)
+        self.Tmax = float(Tmax)
+        self.segments = segments
+        self.degree = degree
+        self.errorKind = errorKind
+        self.h = (self.Tmax - self.Tmin) / segments
+        self.invH = 1 / self.h
+
+        # Fit each segment on its Chebyshev nodes, in the local variable s in [0, 1]. One more segment starts at
+        # Tmax, so that the segment index needs no clipping.
+        nodes = (np.cos(np.pi * (np.arange(degree + 1) + 0.5) / (degree + 1)) + 1) / 2
+        vandermonde = np.vander(nodes, degree + 1, increasing=True)
+        T = self.Tmin + self.h * (np.arange(segments + 1)[:, None] + nodes[None, :])
+        self.coefs = list(np.linalg.solve(vandermonde, func(T).T)) # degree + 1 arrays of segments + 1 coefficients
+
+        self.maxError = self.error()
+
+    def __call__(self, T):
+        T = np.asarray(T, dtype=float)
+        if T.size and self.Tmin <= T.min() and T.max() <= self.Tmax: # False for NaN
+            return self._evaluate(T)
+
+        shape = T.shape
+        T = np.atleast_1d(T)
+        outside = ~((T >= self.Tmin) & (T <= self.Tmax)) # also NaN and infinities
+        inside = T.copy()
+        inside[outside] = self.Tmin # any index in the table, overwritten below
+        result = self._evaluate(inside)
+        result[outside] = self.func(T[outside])
+        return result.reshape(shape)[()]
+
+    def _evaluate(self, T):
+        s = T - self.Tmin
+        s *= self.invH
+        i = s.astype(np.intp)
+        s -= i
+        result = self.coefs[-1].take(i)
+        for c in self.coefs[-2::-1]:
+            result *= s
+            result += c.take(i)
+        return result
+
+    def error(self, samples=32):
+        '''
+        Maximum error against the exact formula, sampled on a grid that avoids the fitting nodes.
+        Relative error, except for logarithms of pressures where the absolute error is the relative error on p.
+        '''
+        T = np.linspace(self.Tmin, self.Tmax, self.segments * samples + 1)
+        exact = self.func(T)
+        if self.errorKind == "absolute":
+            return float(np.max(np.abs(self(T) - exact)))
+        return float(np.max(np.abs(self(T) / exact - 1)))
+
+def tabulated(errorKind="relative", segments=256, degree=3):
+    '''
+    Registers a function of T alone for the "table" backend (see setBackend)
+    '''
+    def decorator(func):
+        _exactFunctions[func.__name__] = (func, errorKind, segments, degree)
+
+        @functools.wraps(func)
+        def wrapper(T):
+            table = _tables.get(func.__name__)
+            if table is None or isinstance(T, float): # tables only pay off on arrays
+                return func(T)
+            return table(T)
+
+        wrapper.exact = func
+        return wrapper
+    return decorator
+
+def setBackend(name="exact", Tmin=150, Tmax=330, tolerance=1e-9):
+    '''
+    Selects the evaluation backend : "exact" or "table" over [Tmin, Tmax] K.
+    Raises ValueError if a table cannot reach the requested tolerance (see tableErrors).
+    '''
+    global backend
+    if name == "table" and not Tmin < Tmax:
+        raise ValueError("Table range [{}, {}] K is empty, Tmin should be below Tmax".format(Tmin, Tmax))
+
+    if name == "exact":
+        _tables.clear()
+    elif name == "table":
+        tables = {}
+        for funcName, (func, errorKind, segments, degree) in _exactFunctions.items():
+            tables[funcName] = _Table(func, Tmin, Tmax, segments, degree, errorKind)
+            if tables[funcName].maxError > tolerance:
+                raise ValueError("Table for {} reaches an error of {:.1e} over [{}, {}] K, above tolerance {:.1e}".format(funcName, tables[funcName].maxError, Tmin, Tmax, tolerance))
+        _tables.clear()
+        _tables.update(tables)
+    else:
+        raise ValueError("Unknown parametrization backend : {}".format(name))
+
+    backend = name
+    clearTermsCache()
+
+def tableErrors():
+    '''
+    Maximum error of each table of the current backend, as measured against the exact formulas when built
+    '''
+    return {name: table.maxError for name, table in _tables.items()}
+
 def gamma_vw(T):
     '''
     Surface tension of the vapour–water interface, in J/m2
@@ -46,7 +164,8 @@ def rho_w_P0(T):
     '''
     Liquid water density at P0 = 0.1 MPa, given in kg/m3
     '''
-    return 1864.3535 - 72.5821489 * T + 2.5194368 * T**2 - 0.049000203 * T**3 + 5.860253e-4 * T**4 - 4.5055151e-6 * T**5 + 2.2616353e-8 * T**6 - 7.3484974e-11 * T**7 + 1.4862784e-13 * T**8 - 1.6984748e-16 * T**9 + 8.3699379e-20 * T**10
+    return ((((((((((8.3699379e-20 * T - 1.6984748e-16) * T + 1.4862784e-13) * T - 7.3484974e-11) * T + 2.2616353e-8) * T - 4.5055151e-6) * T
+               + 5.860253e-4) * T - 0.049000203) * T + 2.5194368) * T - 72.5821489) * T + 1864.3535)
 
 def rho_w(T, P):
     return rho_w_P0(T) + kappa(T) ##### Pas fini
@@ -56,7 +175,7 @@ def nu_w_P0(T):
     Molecular volume of water in m3
     '''
     global M_w
-    return M_w / (constants.Avogadro * rho_w_P0(T))
+    return M_w / (N_A * rho_w_P0(T))
 
 def r_m(T, S_w):
     '''
@@ -64,21 +183,56 @@ def r_m(T, S_w):
     T: Temperature in K
     S_w : Relative humidity approx between 0 and 1
     '''
-    return 2 * gamma_vw(T) * nu_w_P0(T) / (constants.k * T * np.log(S_w))
+    return 2 * gamma_vw(T) * nu_w_P0(T) / (k_B * T * np.log(S_w))
 
 def nu_i_P0(T):
     '''
     Molecular volume of ice, in m3
     '''
     T_red = (T - 273.15) / 273.15
-    return M_w / (constants.Avogadro * rho_ice) / (1 - 0.05294 * T_red - 0.05637 * T_red**2 - 0.002913 * T_red**3)
+    return M_w / (N_A * rho_ice) / (1 - (0.05294 + (0.05637 + 0.002913 * T_red) * T_red) * T_red)
 
 def ln_p_i_P0(T):
     return 9.550426 - 5723.265 / T + 3.53068 * np.log(T) - 0.00728332 * T
 
+@tabulated(errorKind="absolute")
 def ln_p_w_P0(T):
     return 54.842763 - 6763.22 / T - 4.21 * np.log(T) + 0.000367 * T + np.tanh(0.0415 * (T - 218.8)) * (53.878 - 1331.22 / T - 9.44523 * np.log(T) + 0.014025 * T)
 
+SaturationTerms = namedtuple("SaturationTerms", ["ln_p_i", "ln_p_w", "diff", "ratio"])
+
+termsCacheSize = 32 # number of temperature grids kept by saturationTerms
+_termsCache = OrderedDict()
+
+def saturationTerms(Tn):
+    '''
+    ln_p_i_P0, ln_p_w_P0, their difference (ln_p_w - ln_p_i) and exp of that difference (S_i/S_w ratio)
+    on the temperature grid Tn. Results are cached per grid content with LRU eviction and are read-only.
+    '''
+    Tn = np.asarray(Tn, dtype=float)
+    key = (backend, Tn.shape, Tn.tobytes())
+
+    terms = _termsCache.get(key)
+    if terms is not None:
+        _termsCache.move_to_end(key)
+        return terms
+
+    ln_p_i = ln_p_i_P0(Tn)
+    ln_p_w = ln_p_w_P0(Tn)
+    diff = ln_p_w - ln_p_i
+    terms = SaturationTerms(ln_p_i, ln_p_w, diff, np.exp(diff))
+    for array in terms:
+        array.setflags(write=False)
+
+    _termsCache[key] = terms
+    while len(_termsCache) > termsCacheSize:
+        _termsCache.popitem(last=False)
+
+    return terms
+
+def clearTermsCache():
+    _termsCache.clear()
+
 def S_w2S_i_P0(T, S_w):
     return np.exp(np.log(S_w) + ln_p_w_P0(T) - ln_p_i_P0(T))
 
@@ -113,7 +267,7 @@ def cos_theta_iw(T):
     return (gamma_vw(T) - gamma_iw(T,P=0.1)) / gamma_vi(T)
 
 def criticalOutOfPoresGrowthRadius(T, S_i):
-    return 4 * gamma_vi(T) * nu_i_P0(T) * cos_theta_iw(T) / (constants.k * T * np.log(S_i))
+    return 4 * gamma_vi(T) * nu_i_P0(T) * cos_theta_iw(T) / (k_B * T * np.log(S_i))
 
 def Delta_mu_iw(T,Delta_P):
     return Delta_P * nu_i_P0(T) - Delta_P ######## Pas fini
@@ -0,0 +1,148 @@
+from bisect import bisect_left, insort
+from collections import defaultdict
+from contextlib import contextmanager
+import fnmatch
+import re
+
+class Entry:
+    '''
+    A named artist of a graph, with its optional label
+    kind : "line", "member" (of a FamilyCollection), "scatter", "contour" (a ContourSet) or "image" (a heatmap)
+    '''
+    def __init__(self, name, artist, kind="line", label=None, family=None, tags=()):
+        self.name = name
+        self.artist = artist
+        self.kind = kind
+        self.label = label
+        self.family = family
+        self.tags = set(tags)
+
+    def artists(self):
+        return [self.artist] if self.label is None else [self.artist, self.label]
+
+class ArtistRegistry:
+    '''
+    Named artists of a graph, indexed by name (with a sorted index for prefix lookups), family and tag.
+    Changes made inside a transaction are recorded as one step of the undo stack.
+
+    Expressions accepted by match :
+        *               every artist
+        family:NAME     artists of a family
+        tag:NAME        artists carrying a tag
+        glob:PATTERN    shell-style pattern on names
+        anything else   regular expression matched at the start of names (re.match)
+    '''
+    def __init__(self, undoDepth=50):
+        self.entries = {}
+        self._sortedNames = []
+        self._families = defaultdict(set)
+        self._tags = defaultdict(set)
+
+        self.undoDepth = undoDepth
+        self.undoStack = []
+        self._transaction = None
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def __getitem__(self, name):
+        return self.entries[name]
+
+    def __iter__(self):
+        return iter(list(self.entries.values()))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, name, default=None):
+        return self.entries.get(name, default)
+
+    def names(self):
+        return list(self.entries.keys())
+
+    def add(self, entry):
+        if entry.name in self.entries:
+            raise KeyError("Artist {} already registered".format(entry.name))
+
+        self.entries[entry.name] = entry
+        insort(self._sortedNames, entry.name)
+        if entry.family is not None:
+            self._families[entry.family].add(entry.name)
+        for tag in entry.tags:
+            self._tags[tag].add(entry.name)
+
+    def remove(self, name):
+        entry = self.entries.pop(name)
+        del self._sortedNames[bisect_left(self._sortedNames, name)]
+        if entry.family is not None:
+            self._families[entry.family].discard(name)
+        for tag in entry.tags:
+            self._tags[tag].discard(name)
+        return entry
+
+    def tag(self, name, tag):
+        self.entries[name].tags.add(tag)
+        self._tags[tag].add(name)
+
+    def untag(self, name, tag):
+        self.entries[name].tags.discard(tag)
+        self._tags[tag].discard(name)
+
+    def _prefixed(self, prefix):
+        start = bisect_left(self._sortedNames, prefix)
+        stop = bisect_left(self._sortedNames, prefix + "\U0010ffff")
+        return set(self._sortedNames[start:stop])
+
+    def match(self, expression):
+        '''
+        Names matching expression (see class docstring), sorted except for "*" which keeps insertion order
+        '''
+        if expression == "*":
+            return self.names()
+        elif expression.startswith("family:"):
+            names = self._families.get(expression[len("family:"):], set())
+        elif expression.startswith("tag:"):
+            names = self._tags.get(expression[len("tag:"):], set())
+        elif expression.startswith("glob:"):
+            pattern = re.compile(fnmatch.translate(expression[len("glob:"):]))
+            names = {name for name in self.entries if pattern.match(name)}
+        elif re.escape(expression) == expression: # plain name : prefix lookup, same result as re.match
+            names = self._prefixed(expression)
+        else:
+            pattern = re.compile(expression)
+            names = {name for name in self.entries if pattern.match(name)}
+
+        return sorted(names)
+
+    @contextmanager
+    def transaction(self):
+        '''
+        Groups the changes recorded meanwhile into a single undo step. Nested transactions join the outer one.
+        '''
+        if self._transaction is not None:
+            yield self._transaction
+            return
+
+        self._transaction = []
+        try:
+            yield self._transaction
+        finally:
+            if self._transaction:
+                self.undoStack.append(self._transaction)
+                del self.undoStack[:-self.undoDepth]
+            self._transaction = None
+
+    def record(self, action, entry, value=None):
+        '''
+        Records a change for undo : ("visible" | "color" | "width", entry, old value) or ("delete", entry)
+        '''
+        if self._transaction is not None:
+            self._transaction.append((action, entry, value))
+
+    def popUndo(self):
+        '''
+        Returns the changes of the last transaction, most recent first, or None if there is nothing to undo
+        '''
+        if not self.undoStack:
+            return None
+        return list(reversed(self.undoStack.pop()))
@@ -0,0 +1,70 @@
+import functools
+
+import numpy as np
+
+import parametrization
+
+# Adaptive temperature grids : intervals of a coarse uniform grid are halved while linear interpolation between
+# their ends misses the sampled functions at their midpoint by more than a relative tolerance. Points gather
+# where the curves bend (low temperatures, the tanh transition of ln_p_w_P0 around 219 K) and stay sparse where
+# they are nearly straight, so that widening the range adds few points.
+#
+# The curves of the S_i T diagram are constant multiples of two shapes of T : exp(ln_p_w - ln_p_i) for S_w lines,
+# and exp(-ln_p_i) for frost point and ambient S_w/RH lines (S_i lines are flat). A relative error does not depend
+# on the multiple, so one grid refined on these two shapes serves every curve drawn on it.
+
+def refine(functions, start, end, tol=1e-3, initial=16, minStep=1e-3, maxPoints=10000):
+    '''
+    Ascending temperatures between start and end (in either order) on which linear interpolation of each of
+    functions (vectorized functions of T) stays within tol, relative to the function value, at the middle of
+    every interval. Intervals narrower than minStep are not split, and splits with the largest errors are kept
+    first when maxPoints would be exceeded. Non-finite values count as converged.
+    '''
+    start, end = sorted((start, end))
+    T = np.linspace(start, end, initial + 1)
+    with np.errstate(all="ignore"):
+        values = np.array([function(T) for function in functions], dtype=float).reshape(len(functions), T.size)
+        active = np.ones(T.size - 1, dtype=bool) # intervals still to check : only the halves of split ones
+
+        while active.any() and T.size < maxPoints:
+            intervals = np.flatnonzero(active & (np.diff(T) > 2 * minStep))
+            middle = (T[intervals] + T[intervals + 1]) / 2
+            middleValues = np.array([function(middle) for function in functions], dtype=float).reshape(len(functions), middle.size)
+            linear = (values[:, intervals] + values[:, intervals + 1]) / 2
+            error = np.nan_to_num(np.max(np.abs(middleValues - linear) / np.abs(middleValues), axis=0, initial=0), nan=0.0, posinf=0.0)
+
+            split = np.flatnonzero(error > tol)
+            if split.size > maxPoints - T.size:
+                split = np.sort(split[np.argsort(error[split])[::-1][:maxPoints - T.size]])
+            intervals = intervals[split]
+
+            T = np.insert(T, intervals + 1, middle[split])
+            values = np.insert(values, intervals + 1, middleValues[:, split], axis=1)
+            active = np.zeros(T.size - 1, dtype=bool)
+            halves = intervals + np.arange(intervals.size) # the left half of each split interval after insertion
+            active[halves] = True
+            active[halves + 1] = True
+
+    return T
+
+def diagramShapes():
+    '''
+    Shapes of the curves of the S_i T diagram, see the top of this module
+    '''
+    return (lambda T: np.exp(parametrization.ln_p_w_P0(T) - parametrization.ln_p_i_P0(T)),
+            lambda T: np.exp(-parametrization.ln_p_i_P0(T)))
+
+@functools.lru_cache(maxsize=32)
+def _diagramGrid(start, end, tol, backend):
+    T = refine(diagramShapes(), start, end, tol=tol)
+    T.setflags(write=False)
+    return T
+
+def diagramGrid(start, end, tol=1e-3):
+    '''
+    Adaptive grid shared by the curves of the S_i T diagram between start and end (in K), within the relative
+    tolerance tol. Grids are cached and read-only, so that parametrization.saturationTerms is computed once
+    per grid.
+    '''
+    start, end = sorted((float(start), float(end))) # one cache entry per range
+    return _diagramGrid(start, end, float(tol), parametrization.backend)
@@ -0,0 +1,281 @@
+import argparse
+import asyncio
+from collections import defaultdict
+import functools
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+import tempfile
+import threading
+
+import numpy as np
+
+# Local conversion service : a long-running process holding parametrization, evaluating batched array requests
+# for other tools over a Unix socket (or TCP on localhost where Unix sockets are not available).
+#
+# Every message is framed as : header length (uint32, little endian), JSON header, float64 payload.
+#   request  header : {"id": int, "function": name, "shapes": [shape of each argument]}, payload : the arguments
+#   response header : {"id": int, "shape": shape} with the result as payload, or {"id": int, "error": message}
+# A header that cannot be read gets an error with a null id, and the connection is closed (the payload size is unknown).
+#
+# Requests read during the same event loop iteration (from any connection) for the same function are
+# evaluated together : their arguments are broadcast, concatenated, converted in one vectorized call and the
+# result split back. This adds no waiting time, and under load turns many small requests into a few large calls.
+
+functions = {
+    "S_w2S_i_P0": 2, # name : number of arguments
+    "S_i2S_w_P0": 2,
+    "S_w_changeTemp": 3,
+    "Si2p": 2,
+    "p2Si": 2,
+    "T_F": 1,
+    "T_F_MurphyKoop2005": 1,
+    "ln_p_MurphyKoop2005": 1,
+    "dewPoint_S_w": 1,
+    "frostPoint_S_i": 1,
+    "ln_p_i_P0": 1,
+    "ln_p_w_P0": 1,
+}
+
+defaultAddress = os.path.join(tempfile.gettempdir(), "pcfwatcher.sock") if hasattr(socket, "AF_UNIX") else "127.0.0.1:8765"
+
+def parseAddress(address):
+    '''
+    (family, address) of "host:port" (TCP) or of a socket path (Unix)
+    '''
+    host, separator, port = address.rpartition(":")
+    if separator and port.isdigit() and not address.startswith(("/", ".")):
+        return socket.AF_INET, (host or "127.0.0.1", int(port))
+    return socket.AF_UNIX, address
+
+def _frame(header, payload=b""):
+    header = json.dumps(header).encode()
+    return struct.pack("<I", len(header)) + header + payload
+
+class Batcher:
+    '''
+    Collects the requests of an event loop iteration and evaluates them per function in one call
+    '''
+    def __init__(self, loop, maxValues=1 << 22):
+        import parametrization
+
+        self.loop = loop
+        self.functions = {name: getattr(parametrization, name) for name in functions}
+        self.maxValues = maxValues
+        self.pending = defaultdict(list) # name : [(arguments, shape, future)]
+        self.pendingValues = 0
+        self.scheduled = False
+
+        self.requests = 0
+        self.batches = 0
+        self.values = 0
+
+    def submit(self, name, arguments):
+        if name not in self.functions:
+            raise ValueError("Unknown function {}".format(name))
+        if len(arguments) != functions[name]:
+            raise ValueError("{} takes {} arguments, got {}".format(name, functions[name], len(arguments)))
+
+        arguments = np.broadcast_arrays(*arguments) # raises on incompatible shapes, before joining a batch
+        future = self.loop.create_future()
+        self.pending[name].append(([argument.ravel() for argument in arguments], arguments[0].shape, future))
+        self.pendingValues += arguments[0].size
+        self.requests += 1
+
+        if self.pendingValues >= self.maxValues:
+            self.flush()
+        elif not self.scheduled:
+            self.scheduled = True
+            self.loop.call_soon(self.flush)
+        return future
+
+    def flush(self):
+        self.scheduled = False
+        pending, self.pending = self.pending, defaultdict(list)
+        self.pendingValues = 0
+
+        for name, requests in pending.items():
+            sizes = [arguments[0].size for arguments, shape, future in requests]
+            try:
+                joined = [np.concatenate([arguments[i] for arguments, shape, future in requests]) for i in range(functions[name])]
+                with np.errstate(all="ignore"):
+                    result = np.broadcast_to(np.asarray(self.functions[name](*joined), dtype=float), (sum(sizes),))
+            except Exception as e:
+                for arguments, shape, future in requests:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.values += sum(sizes)
+            for (arguments, shape, future), values in zip(requests, np.split(result, np.cumsum(sizes)[:-1])):
+                if not future.done():
+                    future.set_result(values.reshape(shape))
+
+class Server:
+    def __init__(self, address=defaultAddress, maxValues=1 << 22):
+        self.address = address
+        self.maxValues = maxValues
+        self.batcher = None
+
+    @staticmethod
+    def _respond(writer, requestId, future):
+        if writer.is_closing():
+            return
+        if future.exception() is not None:
+            writer.write(_frame({"id": requestId, "error": "{}: {}".format(type(future.exception()).__name__, future.exception())}))
+            return
+        result = future.result()
+        writer.write(_frame({"id": requestId, "shape": list(result.shape)}, np.asarray(result, dtype="<f8").tobytes()))
+
+    async def _handle(self, reader, writer):
+        sock = writer.get_extra_info("socket")
+        if sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        try:
+            while True:
+                size, = struct.unpack("<I", await reader.readexactly(4))
+                try:
+                    header = json.loads(await reader.readexactly(size))
+                    shapes = [tuple(int(length) for length in shape) for shape in header.get("shapes", [])]
+                    if any(length < 0 for shape in shapes for length in shape):
+                        raise ValueError("Negative shape {}".format(header["shapes"]))
+                except (ValueError, TypeError, AttributeError) as e: # the payload size is unknown : the connection is closed
+                    writer.write(_frame({"id": None, "error": "Malformed request, {}: {}".format(type(e).__name__, e)}))
+                    break
+                counts = [int(np.prod(shape)) for shape in shapes]
+                payload = await reader.readexactly(8 * sum(counts))
+
+                if header.get("function") == "_stats":
+                    writer.write(_frame({"id": header.get("id"), "stats": {"requests": self.batcher.requests, "batches": self.batcher.batches, "values": self.batcher.values}}))
+                    continue
+
+                offsets = np.cumsum([0] + counts)
+                arguments = [np.frombuffer(payload, dtype="<f8", count=count, offset=8 * offset).reshape(shape) for count, offset, shape in zip(counts, offsets, shapes)]
+                try:
+                    future = self.batcher.submit(header.get("function"), arguments)
+                except Exception as e:
+                    writer.write(_frame({"id": header.get("id"), "error": "{}: {}".format(type(e).__name__, e)}))
+                    continue
+
+                future.add_done_callback(functools.partial(self._respond, writer, header.get("id")))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            await asyncio.sleep(0) # lets the batch of the last request be answered
+            writer.close()
+
+    async def serve(self, ready=None):
+        self.batcher = Batcher(asyncio.get_running_loop(), self.maxValues)
+        family, address = parseAddress(self.address)
+        if family == socket.AF_UNIX:
+            if os.path.exists(address):
+                os.remove(address)
+            server = await asyncio.start_unix_server(self._handle, address)
+        else:
+            server = await asyncio.start_server(self._handle, *address)
+
+        stop = asyncio.get_running_loop().create_future()
+        try: # stop cleanly on kill, so that the socket file is removed
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: stop.done() or stop.set_result(None))
+        except (NotImplementedError, AttributeError): # Windows
+            pass
+
+        if ready is not None:
+            ready.set()
+        try:
+            async with server:
+                await stop
+        finally:
+            if family == socket.AF_UNIX and os.path.exists(address):
+                os.remove(address)
+
+    def run(self):
+        asyncio.run(self.serve())
+
+class Client:
+    '''
+    Blocking client of the conversion service. Functions are called by name, client.call("S_w2S_i_P0", T, S_w),
+    or as methods, client.S_w2S_i_P0(T, S_w). Arguments are broadcast against each other; the result is an array
+    of the broadcast shape (a float for scalar arguments). A client can be shared between threads.
+    '''
+    def __init__(self, address=defaultAddress, timeout=None):
+        family, target = parseAddress(address)
+        self.socket = socket.socket(family, socket.SOCK_STREAM)
+        self.socket.settimeout(timeout)
+        self.socket.connect(target)
+        if family == socket.AF_INET:
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._lock = threading.Lock()
+        self._id = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __getattr__(self, name):
+        if name in functions:
+            return lambda *arguments: self.call(name, *arguments)
+        raise AttributeError(name)
+
+    def close(self):
+        self.socket.close()
+
+    def _receive(self, size):
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        received = 0
+        while received < size:
+            count = self.socket.recv_into(view[received:])
+            if count == 0:
+                raise ConnectionError("Connection closed by the conversion service")
+            received += count
+        return buffer
+
+    def _exchange(self, header, payload=b""):
+        with self._lock:
+            self._id += 1
+            header = dict(header, id=self._id)
+            self.socket.sendall(_frame(header, payload))
+            size, = struct.unpack("<I", self._receive(4))
+            response = json.loads(self._receive(size))
+            if "shape" in response:
+                response["payload"] = self._receive(8 * int(np.prod(response["shape"])))
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        return response
+
+    def call(self, function, *arguments):
+        arguments = [np.asarray(argument, dtype="<f8") for argument in arguments]
+        response = self._exchange({"function": function, "shapes": [list(argument.shape) for argument in arguments]}, b"".join(argument.tobytes() for argument in arguments))
+        result = np.frombuffer(response["payload"], dtype="<f8").reshape(response["shape"])
+        return float(result) if result.ndim == 0 else result
+
+    def stats(self):
+        '''
+        Requests, evaluated batches and values converted by the service since it started
+        '''
+        return self._exchange({"function": "_stats", "shapes": []})["stats"]
+
+def buildParser(prog="service.py"):
+    parser = argparse.ArgumentParser(prog=prog, description="Serve the parametrization conversions to other processes, as batched array requests")
+    parser.add_argument("-a", "--address", dest="address", default=defaultAddress, help="Unix socket path, or host:port for TCP (default: %(default)s)")
+    parser.add_argument("--backend", dest="backend", choices=["exact", "table"], default="exact", help="parametrization backend (default: %(default)s)")
+    return parser
+
+if __name__ == "__main__":
+    parsedArgs = buildParser().parse_args()
+    import parametrization
+    parametrization.setBackend(parsedArgs.backend)
+    print("Serving on {}".format(parsedArgs.address), flush=True)
+    try:
+        Server(parsedArgs.address).run()
+    except KeyboardInterrupt:
+        pass
+    sys.exit(0)
@@ -0,0 +1,212 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import sys
+
+import numpy as np
+
+import parametrization
+
+# Pore condensation and freezing (PCF) on an ensemble of cylindrical pores along a (T, S_i) trajectory.
+#
+# Model, per step :
+#   - a pore of radius r holds liquid water when r <= -r_m(T, S_w) (capillary condensation, Kelvin equation with
+#     a zero contact angle), or whenever S_w >= 1; liquid evaporates again as soon as this no longer holds
+#   - liquid in pores freezes at T <= T_hom; pore ice stays until it melts (T > T_melt, back to liquid if the pore
+#     is still condensed) or sublimates (S_i < 1)
+#   - pore ice grows out of the pore (the pore is active) when r >= criticalOutOfPoresGrowthRadius(T, S_i)
+#
+# Every condition above is a threshold on r, so with pores sorted by radius each state is a prefix (or a range)
+# of the ensemble : the filled pores are the first fillCount ones, the ice pores the first iceCount ones. The
+# whole state of the ensemble at a step is these counts, and the ice count follows a running maximum reset by
+# melting and sublimation. A step therefore costs two binary searches instead of an update of every pore, and
+# per pore states are only materialized on demand (Result.states).
+
+EMPTY, LIQUID, ICE = 0, 1, 2
+
+class PoreEnsemble:
+    '''
+    Pore radii (in m), with optional weights (numbers of pores of each radius, or volumes to get volume
+    fractions). Radii are kept sorted, with the cumulative weights used to turn counts into fractions.
+    '''
+    def __init__(self, radii, weights=None):
+        radii = np.asarray(radii, dtype=float).ravel()
+        weights = np.ones_like(radii) if weights is None else np.broadcast_to(np.asarray(weights, dtype=float), radii.shape)
+
+        self.order = np.argsort(radii, kind="stable")
+        self.radii = radii[self.order]
+        self.cumWeights = np.concatenate([[0.0], np.cumsum(weights[self.order])])
+
+    def __len__(self):
+        return self.radii.size
+
+    @property
+    def total(self):
+        return self.cumWeights[-1]
+
+    @classmethod
+    def lognormal(cls, median, sigma, n, seed=None):
+        '''
+        n pores with log-normally distributed radii (median in m, sigma of ln r)
+        '''
+        rng = np.random.default_rng(seed)
+        return cls(median * np.exp(sigma * rng.standard_normal(n)))
+
+    def fraction(self, counts):
+        '''
+        Weighted fraction of the pores made of the counts smallest ones
+        '''
+        return self.cumWeights[counts] / self.total
+
+def stepCounts(radii, T, S_i, S_w):
+    '''
+    For each step : number of filled pores (radius <= -r_m) and number of pores below the critical radius for
+    ice growth out of pores (all of them when S_i <= 1). radii must be sorted.
+    '''
+    with np.errstate(all="ignore"):
+        rFill = np.where(S_w >= 1, np.inf, -parametrization.r_m(T, S_w))
+        rCrit = np.where(S_i > 1, parametrization.criticalOutOfPoresGrowthRadius(T, S_i), np.inf)
+    rFill = np.nan_to_num(rFill, nan=0.0)
+    rCrit = np.nan_to_num(rCrit, nan=np.inf)
+    return np.searchsorted(radii, rFill, side="right"), np.searchsorted(radii, rCrit, side="left")
+
+_workerRadii = None
+
+def _initWorker(radii):
+    global _workerRadii
+    _workerRadii = radii
+
+def _workerCounts(T, S_i, S_w):
+    return stepCounts(_workerRadii, T, S_i, S_w)
+
+class Result:
+    '''
+    Outcome of simulate : the trajectory, the counts of pores filled (liquid or ice), frozen and active at every
+    step, and the corresponding weighted fractions
+    '''
+    def __init__(self, ensemble, T, S_i, S_w, fillCount, iceCount, activeCount):
+        self.ensemble = ensemble
+        self.T = T
+        self.S_i = S_i
+        self.S_w = S_w
+        self.fillCount = fillCount
+        self.iceCount = iceCount
+        self.activeCount = activeCount
+
+        self.ice = ensemble.fraction(iceCount)
+        self.liquid = ensemble.fraction(np.maximum(fillCount, iceCount)) - self.ice
+        self.active = self.ice - ensemble.fraction(iceCount - activeCount)
+
+    def __len__(self):
+        return self.T.size
+
+    def states(self, step):
+        '''
+        State (EMPTY, LIQUID or ICE) of every pore at step, in the order the radii were given
+        '''
+        sortedStates = np.full(len(self.ensemble), EMPTY, dtype=np.int8)
+        sortedStates[:max(self.fillCount[step], self.iceCount[step])] = LIQUID
+        sortedStates[:self.iceCount[step]] = ICE
+
+        states = np.empty_like(sortedStates)
+        states[self.ensemble.order] = sortedStates
+        return states
+
+    def export(self, path):
+        '''
+        Writes the trajectory, counts and fractions to a .npz file
+        '''
+        np.savez_compressed(path, T=self.T, S_i=self.S_i, S_w=self.S_w, liquid=self.liquid, ice=self.ice, active=self.active,
+                            fillCount=self.fillCount, iceCount=self.iceCount, activeCount=self.activeCount, radii=self.ensemble.radii)
+
+def simulate(ensemble, T, S_i=None, S_w=None, T_hom=235.0, T_melt=273.15, jobs=1, chunkSize=100000):
+    '''
+    Runs the PCF model (see the top of this module) on ensemble along the trajectory T (in K) with S_i or S_w.
+    Pores start empty. With jobs > 1, the per-step thresholds are computed in worker processes over chunks of
+    chunkSize steps; the ice state, which depends on the past, is then resolved in one vectorized scan.
+    '''
+    T = np.asarray(T, dtype=float).ravel()
+    with np.errstate(all="ignore"):
+        if S_i is not None:
+            S_i = np.broadcast_to(np.asarray(S_i, dtype=float), T.shape)
+            S_w = parametrization.S_i2S_w_P0(T, S_i)
+        elif S_w is not None:
+            S_w = np.broadcast_to(np.asarray(S_w, dtype=float), T.shape)
+            S_i = parametrization.S_w2S_i_P0(T, S_w)
+        else:
+            raise ValueError("Either S_i or S_w is needed")
+
+    if jobs is not None and jobs > 1 and T.size > chunkSize:
+        chunks = [slice(start, start + chunkSize) for start in range(0, T.size, chunkSize)]
+        # not forked : simulate is reachable from the interactive CLI, which holds a GUI backend and the Logger thread
+        context = multiprocessing.get_context("forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=context, initializer=_initWorker, initargs=(ensemble.radii,)) as executor:
+            counts = list(executor.map(_workerCounts, *zip(*[(T[chunk], S_i[chunk], S_w[chunk]) for chunk in chunks])))
+        fillCount = np.concatenate([fill for fill, crit in counts])
+        critCount = np.concatenate([crit for fill, crit in counts])
+    else:
+        fillCount, critCount = stepCounts(ensemble.radii, T, S_i, S_w)
+
+    # Ice count : running maximum of the pores filled at freezing steps, restarted after melting or sublimation.
+    # Offsetting each segment by (n + 1) * segment number lets a single maximum.accumulate restart at resets.
+    reset = (T > T_melt) | ~(S_i >= 1)
+    fillCount = np.where((T <= T_hom) & reset, 0, fillCount) # condensate freezes and sublimates at once
+    candidate = np.where((T <= T_hom) & ~reset, fillCount, 0)
+    offset = np.cumsum(reset) * (len(ensemble) + 1)
+    iceCount = np.maximum.accumulate(candidate + offset) - offset
+    activeCount = np.maximum(iceCount - critCount, 0)
+
+    return Result(ensemble, T, np.asarray(S_i), np.asarray(S_w), fillCount, iceCount, activeCount)
+
+def loadTrajectory(path):
+    '''
+    (T, S_i, S_w) from a .npz file with arrays T and S_i or S_w, or from a .csv file with a header naming these
+    columns. The missing one of S_i and S_w is None.
+    '''
+    if path.endswith(".npz"):
+        with np.load(path) as data:
+            columns = {name: data[name] for name in data.files}
+    else:
+        data = np.genfromtxt(path, delimiter=",", names=True, dtype=float)
+        columns = {name: data[name] for name in data.dtype.names}
+
+    if "T" not in columns or not ("S_i" in columns or "S_w" in columns):
+        raise ValueError("{} should hold a T column and a S_i or S_w column".format(path))
+    return columns["T"], columns.get("S_i"), (columns.get("S_w") if "S_i" not in columns else None)
+
+def ensembleFromArgs(parsedArgs):
+    if parsedArgs.radii is not None:
+        radii = np.load(parsedArgs.radii, mmap_mode="r")
+        weights = np.load(parsedArgs.weights, mmap_mode="r") if parsedArgs.weights is not None else None
+        return PoreEnsemble(radii * 1e-9, weights)
+    return PoreEnsemble.lognormal(parsedArgs.median * 1e-9, parsedArgs.sigma, parsedArgs.pores, seed=parsedArgs.seed)
+
+def buildParser(prog="pcf", exit_on_error=True):
+    parser = argparse.ArgumentParser(prog=prog, exit_on_error=exit_on_error, description="Pore condensation and freezing on a pore ensemble along a (T, S_i) or (T, S_w) trajectory")
+    parser.add_argument("trajectory", help="Trajectory file : .npz with arrays T and S_i or S_w, or .csv with a header naming these columns")
+    parser.add_argument("-r", "--radii", dest="radii", default=None, help=".npy file of pore radii in nm (default: a log-normal distribution, see --median)")
+    parser.add_argument("--weights", dest="weights", default=None, help=".npy file of weights of the radii, e.g. pore counts or volumes")
+    parser.add_argument("--median", dest="median", type=float, default=10, help="Median pore radius of the log-normal distribution, in nm (default: %(default)s)")
+    parser.add_argument("--sigma", dest="sigma", type=float, default=0.3, help="Standard deviation of ln(r) (default: %(default)s)")
+    parser.add_argument("-n", "--pores", dest="pores", type=int, default=1000000, help="Number of pores of the log-normal distribution (default: %(default)s)")
+    parser.add_argument("--seed", dest="seed", type=int, default=0, help="Random seed of the distribution (default: %(default)s)")
+    parser.add_argument("-H", "--T_hom", dest="T_hom", type=float, default=235.0, help="Homogeneous freezing temperature of pore water, in K (default: %(default)s)")
+    parser.add_argument("-j", "--jobs", dest="jobs", type=int, default=1, help="Worker processes computing the thresholds over trajectory chunks (default: %(default)s)")
+    parser.add_argument("-o", "--output", dest="output", default=None, help="Write the result arrays to this .npz file")
+    return parser
+
+def run(parsedArgs):
+    T, S_i, S_w = loadTrajectory(parsedArgs.trajectory)
+    result = simulate(ensembleFromArgs(parsedArgs), T, S_i=S_i, S_w=S_w, T_hom=parsedArgs.T_hom, jobs=parsedArgs.jobs)
+    if parsedArgs.output:
+        directory = os.path.dirname(parsedArgs.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        result.export(parsedArgs.output)
+    return result
+
+if __name__ == "__main__":
+    result = run(buildParser(prog="simulation.py").parse_args())
+    print("{} steps, {} pores : final liquid {:.3f}, ice {:.3f}, active {:.3f}, max active {:.3f}".format(len(result), len(result.ensemble), result.liquid[-1], result.ice[-1], result.active[-1], result.active.max()))
+    sys.exit(0)
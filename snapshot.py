@@ -0,0 +1,267 @@
+import functools
+import json
+
+import matplotlib.colors as mcolors
+import matplotlib.lines
+import matplotlib.text
+import matplotlib.transforms as mtransforms
+from matplotlib.collections import PathCollection
+from matplotlib.contour import ContourSet
+from matplotlib.path import Path
+import numpy as np
+
+from families import FamilyCollection, FamilyLabel
+import fields
+import ingest
+
+# Session snapshots : the registered artists of a Graph written to a single .npz file, and rebuilt from it without
+# recomputing any curve, label placement or contour. The file holds
+#   Tn    the temperature grid of the graph, stored once : curves drawn on it only store their y values
+#   data  every other array (curve values, family rows, scatter offsets, contour paths, heatmaps...) packed in a
+#         single float64 buffer, so that loading reads one array whatever the number of curves
+#   meta  JSON describing the view and the entries in registration order (kind, tags, style, visibility, label
+#         placement), with references [offset, shape, dtype] into data
+# Trajectories are stored as the points they draw for the whole run (ingest.decimate) and live watches as the
+# samples they currently show : both come back as plain lines, neither refined on zoom nor followed.
+
+version = 1
+
+class _Packer:
+    def __init__(self, Tn):
+        self.Tn = Tn
+        self.arrays = []
+        self.size = 0
+
+    def add(self, values):
+        values = np.asarray(values)
+        self.arrays.append(values.astype(float).ravel())
+        reference = [self.size, list(values.shape), values.dtype.str]
+        self.size += values.size
+        return reference
+
+    def x(self, x):
+        x = np.asarray(x, dtype=float)
+        if x.shape == self.Tn.shape and np.array_equal(x, self.Tn):
+            return "Tn"
+        return self.add(x)
+
+    def data(self):
+        return np.concatenate(self.arrays) if self.arrays else np.empty(0)
+
+def _unpack(data, Tn, reference):
+    if reference is None:
+        return None
+    if isinstance(reference, str):
+        return Tn
+    offset, shape, dtype = reference
+    return data[offset:offset + int(np.prod(shape))].astype(dtype).reshape(shape)
+
+def _rgba(color):
+    return [float(value) for value in mcolors.to_rgba(color)]
+
+def _style(artist):
+    return {"zorder": float(artist.get_zorder()), "alpha": artist.get_alpha(), "visible": bool(artist.get_visible())}
+
+def _applyStyle(artist, record):
+    artist.set_zorder(record["zorder"])
+    artist.set_alpha(record["alpha"])
+    artist.set_visible(record["visible"])
+
+def _lineRecord(ax, line, packer):
+    x, y = line.get_xdata(), line.get_ydata()
+    if isinstance(line, ingest.TrajectoryLine):
+        x, y = ingest.decimate(line.trajectory, (-np.inf, np.inf), (-np.inf, np.inf), line.target)
+    return dict(_style(line), x=packer.x(x), y=packer.add(np.asarray(y, dtype=float)), label=line.get_label(),
+                transform="xaxis" if line.get_transform() is ax.get_xaxis_transform() else "data", # axvline
+                color=_rgba(line.get_color()), lw=float(line.get_linewidth()), ls=line.get_linestyle(),
+                marker=str(line.get_marker()), markersize=float(line.get_markersize()))
+
+def _line(ax, data, Tn, record):
+    line = matplotlib.lines.Line2D(_unpack(data, Tn, record["x"]), _unpack(data, Tn, record["y"]), label=record["label"], color=record["color"],
+                                   lw=record["lw"], linestyle=record["ls"], marker=record["marker"], markersize=record["markersize"])
+    if record["transform"] == "xaxis":
+        line.set_transform(ax.get_xaxis_transform())
+    _applyStyle(line, record)
+    ax.add_line(line)
+    return line
+
+def _textRecord(txt):
+    record = dict(_style(txt), text=txt.get_text(), position=[float(value) for value in txt.get_position()],
+                  rotation=float(txt.get_rotation()), color=_rgba(txt.get_color()), fontsize=float(txt.get_fontsize()))
+    if hasattr(txt, "_anchor_a"): # labellines' LineLabel or FamilyLabel
+        record.update(anchors=[[float(value) for value in txt._anchor_a], [float(value) for value in txt._anchor_b]], align=bool(txt._auto_align))
+    return record
+
+def _familyRecord(collection, packer):
+    rows = np.flatnonzero(collection.alive)
+    return dict(_style(collection), x=packer.x(collection.x), Y=packer.add(collection.Y[rows]),
+                names=[collection.names[row] for row in rows], labels=[collection.labels[row] for row in rows],
+                colors=packer.add(collection.memberColors[rows]), widths=packer.add(collection.memberWidths[rows]),
+                shown=packer.add(collection.shown[rows])), rows
+
+def _family(ax, data, Tn, record):
+    collection = FamilyCollection(_unpack(data, Tn, record["x"]), _unpack(data, Tn, record["Y"]), record["names"], record["labels"])
+    collection.memberColors = _unpack(data, Tn, record["colors"])
+    collection.memberWidths = _unpack(data, Tn, record["widths"])
+    collection.shown = _unpack(data, Tn, record["shown"])
+    collection._changed()
+    _applyStyle(collection, record)
+    ax.add_collection(collection, autolim=False)
+    return collection
+
+def _scatterRecord(collection, packer):
+    path = collection.get_paths()[0]
+    return dict(_style(collection), label=collection.get_label(), offsets=packer.add(np.ma.getdata(collection.get_offsets())),
+                vertices=packer.add(path.vertices), codes=packer.add(path.codes) if path.codes is not None else None,
+                sizes=packer.add(collection.get_sizes()), facecolors=packer.add(collection.get_facecolor()),
+                edgecolors=packer.add(collection.get_edgecolor()), linewidths=packer.add(np.atleast_1d(collection.get_linewidth())))
+
+def _scatter(ax, data, Tn, record):
+    # as built by Axes.scatter : the marker path in points, placed at the offsets in data coordinates
+    unpack = lambda reference: _unpack(data, Tn, reference)
+    collection = PathCollection((Path(unpack(record["vertices"]), unpack(record["codes"])),), unpack(record["sizes"]), offsets=unpack(record["offsets"]),
+                                offset_transform=ax.transData, facecolors=unpack(record["facecolors"]), edgecolors=unpack(record["edgecolors"]),
+                                linewidths=unpack(record["linewidths"]), label=record["label"])
+    collection.set_transform(mtransforms.IdentityTransform())
+    _applyStyle(collection, record)
+    ax.add_collection(collection, autolim=False)
+    return collection
+
+def _contourRecord(contours, packer):
+    paths = contours.get_paths()
+    return dict(_style(contours), levels=packer.add(contours.levels), vertices=[packer.add(path.vertices) for path in paths],
+                codes=[packer.add(path.codes) if path.codes is not None else None for path in paths],
+                colors=packer.add(contours.get_edgecolor()), linewidths=packer.add(np.atleast_1d(contours.get_linewidth())))
+
+def _contour(ax, data, Tn, record):
+    unpack = lambda reference: _unpack(data, Tn, reference)
+    contours = ContourSet(ax, unpack(record["levels"]), [[unpack(vertices)] for vertices in record["vertices"]], [[unpack(codes)] for codes in record["codes"]],
+                          colors=unpack(record["colors"]), linewidths=unpack(record["linewidths"]))
+    _applyStyle(contours, record)
+    return contours
+
+def _imageRecord(image, packer):
+    values = image.get_array()
+    norm = image.norm
+    return dict(_style(image), values=packer.add(np.ma.getdata(values)), mask=packer.add(np.ma.getmaskarray(values)),
+                extent=[float(value) for value in image.get_extent()], origin=image.origin, interpolation=image.get_interpolation(),
+                cmap=image.get_cmap().name, norm="log" if isinstance(norm, mcolors.LogNorm) else "linear",
+                vmin=float(norm.vmin), vmax=float(norm.vmax))
+
+def _image(ax, data, Tn, record):
+    values = np.ma.MaskedArray(_unpack(data, Tn, record["values"]), _unpack(data, Tn, record["mask"]))
+    norm = (mcolors.LogNorm if record["norm"] == "log" else mcolors.Normalize)(vmin=record["vmin"], vmax=record["vmax"])
+    image = ax.imshow(values, extent=record["extent"], origin=record["origin"], aspect="auto", interpolation=record["interpolation"], cmap=record["cmap"], norm=norm)
+    _applyStyle(image, record)
+    return image
+
+def _labelRecord(ax, entry, packer):
+    label = entry.label
+    if label is None:
+        return None
+    if isinstance(label, fields.ContourLabels):
+        return {"type": "contour", "texts": [_textRecord(text) for text in label.texts], "zorder": float(label.get_zorder()), "visible": bool(label.get_visible())}
+    if isinstance(label, matplotlib.lines.Line2D): # marker of a live watch
+        return dict(_lineRecord(ax, label, packer), type="line")
+    return dict(_textRecord(label), type="text")
+
+def _label(ax, data, Tn, record):
+    if record["type"] == "line":
+        return _line(ax, data, Tn, record)
+
+    if record["type"] == "contour":
+        texts = [matplotlib.text.Text(*text["position"], text["text"], rotation=text["rotation"], color=text["color"], fontsize=text["fontsize"],
+                                      horizontalalignment="center", verticalalignment="center", zorder=text["zorder"], transform=ax.transData)
+                 for text in record["texts"]]
+        label = fields.ContourLabels.fromTexts(ax, texts)
+        label.set_visible(record["visible"])
+        ax.add_artist(label)
+        return label
+
+    if "anchors" in record:
+        label = FamilyLabel(*record["position"], record["text"], *record["anchors"], align=record["align"], rotation=record["rotation"], color=record["color"],
+                            fontsize=record["fontsize"], outline_color=ax.get_facecolor())
+    else:
+        label = matplotlib.text.Text(*record["position"], record["text"], rotation=record["rotation"], color=record["color"], fontsize=record["fontsize"])
+    _applyStyle(label, record)
+    ax.add_artist(label)
+    label.set_clip_path(ax.patch)
+    return label
+
+def save(graph, path):
+    '''
+    Writes the artists of graph, with their labels (pending ones are placed first), and its view to path (.npz)
+    '''
+    graph.placeLabels()
+    ax = graph.ax
+    packer = _Packer(np.asarray(graph.Tn, dtype=float))
+
+    drawOrder = {id(artist): i for i, artist in enumerate(ax.get_children())} # order of artists with the same zorder
+    collections = {} # id of a FamilyCollection : (index in the snapshot, position of each of its rows)
+    collectionRecords = []
+    entries = []
+    for entry in graph.artists:
+        record = {"name": entry.name, "kind": entry.kind, "family": entry.family, "tags": sorted(entry.tags)}
+        if entry.kind == "member":
+            collection = entry.artist.family
+            if id(collection) not in collections:
+                collectionRecord, rows = _familyRecord(collection, packer)
+                collectionRecord["order"] = drawOrder.get(id(collection), -1)
+                collections[id(collection)] = (len(collectionRecords), {row: i for i, row in enumerate(rows)})
+                collectionRecords.append(collectionRecord)
+            index, positions = collections[id(collection)]
+            record.update(collection=index, member=positions[entry.artist.index])
+        elif entry.kind == "scatter":
+            record["artist"] = _scatterRecord(entry.artist, packer)
+        elif entry.kind == "contour":
+            record["artist"] = _contourRecord(entry.artist, packer)
+        elif entry.kind == "image":
+            record["artist"] = _imageRecord(entry.artist, packer)
+        else:
+            record["artist"] = _lineRecord(ax, entry.artist, packer)
+        if "artist" in record:
+            record["artist"]["order"] = drawOrder.get(id(entry.artist), -1)
+        record["label"] = _labelRecord(ax, entry, packer)
+        if record["label"] is not None:
+            record["label"]["order"] = drawOrder.get(id(entry.label), -1)
+        entries.append(record)
+
+    meta = {"version": version, "xlim": [float(value) for value in ax.get_xlim()], "ylim": [float(value) for value in ax.get_ylim()],
+            "collections": collectionRecords, "entries": entries}
+    np.savez_compressed(path, Tn=packer.Tn, data=packer.data(), meta=np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8))
+
+def load(graph, path):
+    '''
+    Replaces the artists of graph with those of a snapshot written by save, and restores its Tn and view.
+    Removing the current artists is one undo step.
+    '''
+    with np.load(path) as archive:
+        Tn, data = archive["Tn"], archive["data"]
+        meta = json.loads(archive["meta"].tobytes().decode())
+    if meta.get("version") != version:
+        raise ValueError("{} is not a snapshot of version {}".format(path, version))
+
+    ax = graph.ax
+    graph.deleteMany(graph.artists.names())
+    graph.Tn = Tn
+
+    # artists are created in their saved drawing order, then registered in their saved registration order
+    builders = {"scatter": _scatter, "contour": _contour, "image": _image}
+    tasks = [(record["order"], ("collection", i), functools.partial(_family, ax, data, Tn, record)) for i, record in enumerate(meta["collections"])]
+    for i, record in enumerate(meta["entries"]):
+        if "artist" in record:
+            tasks.append((record["artist"]["order"], ("artist", i), functools.partial(builders.get(record["kind"], _line), ax, data, Tn, record["artist"])))
+        if record["label"] is not None:
+            tasks.append((record["label"]["order"], ("label", i), functools.partial(_label, ax, data, Tn, record["label"])))
+    built = {key: build() for order, key, build in sorted(tasks, key=lambda task: task[0])}
+
+    for i, record in enumerate(meta["entries"]):
+        if record["kind"] == "member":
+            artist = built[("collection", record["collection"])].members[record["member"]]
+        else:
+            artist = built[("artist", i)]
+        graph.register(record["name"], artist, label=built.get(("label", i)), kind=record["kind"], family=record["family"], tags=record["tags"])
+
+    ax.set_xlim(meta["xlim"])
+    ax.set_ylim(meta["ylim"])
+    graph.invalidate()
@@ -0,0 +1,122 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import itertools
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+class MemoryLogger:
+    '''
+    Logger used by the sweep workers : keeps the messages so that failures can be reported by the main process
+    '''
+    def __init__(self):
+        self.messages = []
+
+    def log(self, message : str, level: int=5):
+        self.messages.append((level, message))
+
+def parseParameter(text):
+    '''
+    "name=v1,v2,..." or "name=start:stop:num" (num values, both ends included) -> (name, values)
+    '''
+    name, _, values = text.partition("=")
+    if not name or not values:
+        raise ValueError("Parameter should be given as name=v1,v2,... or name=start:stop:num, got {}".format(text))
+
+    if ":" in values:
+        start, stop, num = values.split(":")
+        return name, [float(value) for value in np.linspace(float(start), float(stop), int(num))]
+    return name, [float(value) for value in values.split(",")]
+
+def parameterGrid(parameters):
+    '''
+    Every combination of the parameters, as a list of {name: value}
+    '''
+    names = [name for name, values in parameters]
+    return [dict(zip(names, combination)) for combination in itertools.product(*[values for name, values in parameters])]
+
+def _initWorker():
+    # workers start from a fresh interpreter (see run) : the backend is chosen before matplotlib is imported
+    os.environ["MPLBACKEND"] = "Agg"
+    if "matplotlib" in sys.modules: # imported by the main module of the parent, preloaded by the fork server
+        sys.modules["matplotlib"].use("Agg")
+
+def renderFigure(index, commands, output):
+    '''
+    Worker : runs commands on a fresh headless S_iTGraph and writes the figure to output
+    '''
+    import matplotlib.pyplot as plt
+    import utils
+
+    start = time.perf_counter()
+    logger = MemoryLogger()
+    CLI = utils.CLI(logger, interactive=False)
+    try:
+        for command in commands:
+            if not CLI.execute(command):
+                errors = [message for level, message in logger.messages if level >= 7]
+                return index, output, False, "{} : {}".format(command, errors[-1] if errors else "unknown command")
+
+        directory = os.path.dirname(output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        CLI.S_iTGraph.savefig(output)
+    except Exception as e: # reported like a failing command, the other figures go on
+        return index, output, False, "{} : {}".format(type(e).__name__, e)
+    finally:
+        if CLI._S_iTGraph is not None: # no graph when no command drew anything
+            plt.close(CLI._S_iTGraph.fig)
+
+    return index, output, True, time.perf_counter() - start
+
+def run(templates, parameters, output, setup=(), jobs=None, progress=print):
+    '''
+    Renders one figure per combination of parameters, in a pool of worker processes.
+    templates, setup and output are formatted with the parameters of each figure (str.format).
+    Returns the list of (parameters, output, success, elapsed time or error message), in grid order.
+    '''
+    grid = parameterGrid(parameters)
+    results = [None] * len(grid)
+    start = time.perf_counter()
+
+    # Workers are not forked from this process : it may hold a GUI backend, open figures and the Logger thread
+    context = multiprocessing.get_context("forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=context, initializer=_initWorker) as executor:
+        futures = []
+        for index, values in enumerate(grid):
+            commands = [command.format(**values) for command in list(setup) + list(templates)]
+            futures.append(executor.submit(renderFigure, index, commands, output.format(**values)))
+
+        for done, future in enumerate(as_completed(futures), start=1):
+            index, path, success, detail = future.result()
+            results[index] = (grid[index], path, success, detail)
+            if success:
+                progress("[{}/{}] {} ({:0.2f}s)".format(done, len(grid), path, detail))
+            else:
+                progress("[{}/{}] {} FAILED : {}".format(done, len(grid), path, detail))
+
+    progress("{} figures in {:0.2f}s".format(len(grid), time.perf_counter() - start))
+    return results
+
+def buildParser(prog="sweep"):
+    parser = argparse.ArgumentParser(prog=prog, exit_on_error=False, description="Render the same diagram for every combination of parameters, one worker process per figure")
+    parser.add_argument("templates", nargs="+", help="Commands run for each figure, with {name} placeholders, e.g. \"graph RH {RH} -T {T}\"")
+    parser.add_argument("-p", "--param", dest="parameters", action="append", type=parseParameter, required=True, help="Parameter values : name=v1,v2,... or name=start:stop:num. Can be repeated.")
+    parser.add_argument("-o", "--output", dest="output", required=True, help="Output file pattern, e.g. \"RH{RH:.0f}_T{T:.0f}.png\"")
+    parser.add_argument("-s", "--setup", dest="setup", default=None, help="Script of commands run before the templates for every figure (placeholders allowed)")
+    parser.add_argument("-j", "--jobs", dest="jobs", type=int, default=None, help="Number of worker processes (default: number of CPUs)")
+    return parser
+
+def setupCommands(path):
+    if path is None:
+        return []
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.strip().startswith("#")]
+
+if __name__ == "__main__":
+    parsedArgs = buildParser(prog="sweep.py").parse_args()
+    results = run(parsedArgs.templates, parsedArgs.parameters, parsedArgs.output, setup=setupCommands(parsedArgs.setup), jobs=parsedArgs.jobs)
+    sys.exit(0 if all(success for values, path, success, detail in results) else 1)
@@ -0,0 +1,34 @@
+import matplotlib
+matplotlib.use("Agg")
+
+import pytest
+
+import utils
+
+class MemoryLogger:
+    def __init__(self):
+        self.messages = []
+
+    def log(self, message, level=5):
+        self.messages.append((level, message))
+
+@pytest.fixture
+def cli():
+    cli = utils.CLI(MemoryLogger(), interactive=False)
+    yield cli
+    if cli._S_iTGraph is not None:
+        matplotlib.pyplot.close(cli._S_iTGraph.fig)
+
+@pytest.mark.parametrize("command", ["graph S_w", "graph iso_S_w --bogus 3", "export", "c2k", "delete", "nonexistent"])
+def test_invalid_commands_fail(cli, command):
+    assert not cli.execute(command)
+
+@pytest.mark.parametrize("command", ["graph S_w 0.5", "graph iso_S_w -h", "export -h", "c2k 10"])
+def test_valid_commands_succeed(cli, command):
+    assert cli.execute(command)
+
+def test_call_keeps_arguments_with_spaces(cli, tmp_path):
+    assert cli.execute("graph S_w 0.5")
+    assert cli.call("export", [str(tmp_path / "my figure.png")])
+    assert (tmp_path / "my figure.png").exists()
+    assert not cli.call("export", [])
@@ -0,0 +1,93 @@
+import io
+import queue
+
+import matplotlib
+matplotlib.use("Agg")
+
+import numpy as np
+import pytest
+
+import graphs
+import live
+
+@pytest.fixture
+def graph():
+    graph = graphs.S_iTGraph()
+    graph.S_w1([])
+    graph.iso_S_w(["-n", "5"])
+    for S_i in (1.2, 1.4, 1.6):
+        graph.S_i([str(S_i)])
+    graph.refresh()
+    yield graph
+    matplotlib.pyplot.close(graph.fig)
+
+def fullDraw(graph):
+    buffer = io.BytesIO()
+    graph.savefig(buffer, format="rgba", dpi=graph.fig.dpi)
+    width, height = graph.fig.canvas.get_width_height(physical=True)
+    return np.frombuffer(buffer.getvalue(), dtype=np.uint8).reshape(height, width, 4)
+
+def assertFrameMatchesFullDraw(graph):
+    frame = np.asarray(graph.fig.canvas.get_renderer().buffer_rgba()).copy()
+    difference = np.abs(frame.astype(int) - fullDraw(graph)).max(axis=2)
+    assert difference.max() <= 8 # antialiasing rounding of blended labels, not missing or misordered artists
+
+@pytest.mark.parametrize("commands", [
+    [("setVisible", ["S_i1.40"], False)],
+    [("setVisible", ["S_w0.5"], False), ("setVisible", ["S_w0.5"], True)],
+    [("deleteMany", ["S_w1"])],
+    [("setColor", ["S_i1.20"], "red")],
+])
+def test_incremental_redraw_matches_full_draw(graph, commands):
+    for method, *args in commands:
+        getattr(graph, method)(*args)
+        graph.refresh()
+    assertFrameMatchesFullDraw(graph)
+
+def test_new_line_is_drawn_below_existing_labels(graph):
+    graph.S_i(["1.41", "-u"]) # passes under the label of S_i1.40
+    graph.refresh()
+    assertFrameMatchesFullDraw(graph)
+
+def test_cached_vline_label_follows_the_view():
+    graph = graphs.S_iTGraph()
+    graph.vline(["250"])
+    graph.refresh()
+    graph.ax.set_ylim(0, 3)
+    graph.vline(["250"]) # replotted : the label placement for the previous view must not be reused
+    graph.refresh()
+    cached = graph.artists["V2.5e+02"].label.get_position()[1]
+    graph._labelCache.clear()
+    graph.vline(["250"])
+    graph.refresh()
+    assert cached == graph.artists["V2.5e+02"].label.get_position()[1]
+    matplotlib.pyplot.close(graph.fig)
+
+class FakeTail:
+    def __init__(self):
+        self.output = queue.Queue()
+        self.errors = queue.Queue()
+
+    def is_alive(self):
+        return True
+
+    def stop(self):
+        pass
+
+def test_watch_frames_redraw_the_watch_alone(graph):
+    tail = FakeTail()
+    watcher = live.Watcher(graph, tail, "watch")
+    drawn = []
+    drawArtists = graph._drawArtists
+    graph._drawArtists = lambda artists: drawn.append(list(artists)) or drawArtists(artists)
+    for T, S_i in ((240, 1.3), (250, 1.5), (260, 1.45)):
+        drawn.clear()
+        tail.output.put((np.array([T]), np.array([S_i])))
+        watcher.update()
+    assert drawn == [[watcher.line, watcher.head]]
+    assertFrameMatchesFullDraw(graph)
+
+    graph.S_i(["1.41", "-u"]) # other changes are drawn with the next frame
+    tail.output.put((np.array([265.0]), np.array([1.4])))
+    watcher.update()
+    assertFrameMatchesFullDraw(graph)
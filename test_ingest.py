@@ -0,0 +1,39 @@
+import os
+
+import numpy as np
+import pytest
+
+import ingest
+
+@pytest.fixture
+def csvPath(tmp_path):
+    path = tmp_path / "run.csv"
+    path.write_text("T,RH\n250,40\n251,41\n\n252,oops\n253\n254,44\n")
+    return str(path)
+
+def test_malformed_lines_are_skipped(csvPath):
+    log = ingest.load(csvPath)
+    assert log.dtype.names == ("T", "RH")
+    np.testing.assert_array_equal(log["T"], [250, 251, 254])
+    np.testing.assert_array_equal(log["RH"], [40, 41, 44])
+    assert sorted(os.listdir(os.path.dirname(csvPath))) == ["run.csv", "run.npy"] # no temporary file left
+
+def test_failed_conversion_leaves_no_npy(csvPath, monkeypatch):
+    def fail(lines, delimiter, width):
+        raise MemoryError
+    monkeypatch.setattr(ingest, "parseRows", fail)
+    with pytest.raises(MemoryError):
+        ingest.csvToNpy(csvPath)
+    assert os.listdir(os.path.dirname(csvPath)) == ["run.csv"]
+
+    monkeypatch.undo() # the next conversion is not skipped
+    np.testing.assert_array_equal(ingest.load(csvPath)["T"], [250, 251, 254])
+
+def test_tail_drops_malformed_lines_like_conversion(csvPath):
+    import live
+    tail = live.Tail(csvPath, fromStart=True)
+    f, partial = tail._open(atEnd=False)
+    f.close()
+    T, S_i = tail._parse(["250,40", "252,oops", "253", "254,44"])
+    np.testing.assert_array_equal(T, [250, 254])
+    assert tail._parse(["1,2,3", "bad"]) is None
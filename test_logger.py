@@ -0,0 +1,35 @@
+import utils
+
+class FullFile:
+    closed = False
+
+    def write(self, text):
+        raise OSError(28, "No space left on device")
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+def test_write_errors_are_reported_and_logging_goes_on(tmp_path, capsys):
+    logger = utils.Logger(str(tmp_path / "log.dat"), logLevelConsole=10)
+    f, logger.f = logger.f, FullFile()
+    logger.log("lost")
+    logger.flush() # returns although the batch could not be written
+    assert "No space left on device" in capsys.readouterr().err
+
+    logger.f = f
+    logger.log("kept")
+    logger.close()
+    assert "kept" in (tmp_path / "log.dat").read_text()
+
+def test_failed_rotation_keeps_the_current_file(tmp_path, capsys):
+    (tmp_path / "log.dat.1").mkdir() # the backup cannot replace a directory
+    logger = utils.Logger(str(tmp_path / "log.dat"), logLevelConsole=10, maxBytes=1, backupCount=1)
+    for message in ("first", "second"):
+        logger.log(message)
+        logger.flush()
+    logger.close()
+    assert capsys.readouterr().err.count("Logger : could not write") == 1
+    assert "second" in (tmp_path / "log.dat").read_text()
@@ -0,0 +1,111 @@
+import matplotlib
+matplotlib.use("Agg")
+
+import numpy as np
+import pytest
+
+import graphs
+import parametrization
+
+Tn = np.linspace(235, 293, 100)
+S_wn = np.array([0.1, 0.5, 0.9, 1.0])
+
+@pytest.fixture
+def graph():
+    graph = graphs.S_iTGraph(Tn=Tn)
+    graph.deferred = True
+    yield graph
+    matplotlib.pyplot.close(graph.fig)
+
+def scalarLoop(function, *arguments):
+    '''
+    Evaluates function once per element of the broadcast arguments, as the curves were built before vectorization
+    '''
+    arguments = np.broadcast_arrays(*[np.asarray(argument, dtype=float) for argument in arguments])
+    return np.array([function(*[float(argument[index]) for argument in arguments]) for index in np.ndindex(arguments[0].shape)]).reshape(arguments[0].shape)
+
+@pytest.mark.parametrize("name, arguments", [
+    ("S_w2S_i_P0", (Tn[None, :], S_wn[:, None])),
+    ("S_i2S_w_P0", (Tn[None, :], S_wn[:, None] + 1)),
+    ("S_w_changeTemp", (Tn[None, :], 296.0, S_wn[:, None])),
+    ("ln_p_i_P0", (Tn,)),
+    ("ln_p_w_P0", (Tn,)),
+    ("rho_w_P0", (Tn,)),
+    ("nu_i_P0", (Tn,)),
+    ("ln_p_MurphyKoop2005", (Tn,)),
+])
+def test_functions_broadcast_like_scalar_loops(name, arguments):
+    function = getattr(parametrization, name)
+    np.testing.assert_allclose(function(*arguments), scalarLoop(function, *arguments), rtol=1e-12)
+
+def test_saturation_terms_match_scalar_loops():
+    terms = parametrization.saturationTerms(Tn)
+    np.testing.assert_allclose(terms.ratio, scalarLoop(lambda T: parametrization.S_w2S_i_P0(T, 1.0), Tn), rtol=1e-12)
+
+@pytest.mark.parametrize("command, name, reference", [
+    ("S_w1", "S_w1", lambda T: parametrization.S_w2S_i_P0(T, 1.0)),
+    ("S_w 0.7", "S_w0.70", lambda T: parametrization.S_w2S_i_P0(T, 0.7)),
+    ("S_i 1.3", "S_i1.30", lambda T: 1.3),
+    ("T_F 250", "T_F250.00", lambda T: np.exp(parametrization.ln_p_MurphyKoop2005(250.0) - parametrization.ln_p_i_P0(T))),
+    ("ambiant_S_w 0.4", "S_wT0.40", lambda T: parametrization.S_w2S_i_P0(T, parametrization.S_w_changeTemp(T, 296.0, 0.4))),
+    ("RH 40", "RHT40.00", lambda T: parametrization.S_w2S_i_P0(T, parametrization.S_w_changeTemp(T, 296.0, 0.4))),
+])
+def test_graph_curves_match_scalar_loops(graph, command, name, reference):
+    command, *args = command.split(" ")
+    getattr(graph, command)(args)
+    line = graph.artists[name].artist
+    np.testing.assert_allclose(line.get_xdata(), Tn)
+    np.testing.assert_allclose(line.get_ydata(), scalarLoop(reference, Tn), rtol=1e-12)
+
+def test_graph_families_match_scalar_loops(graph):
+    graph.iso_S_w(["-s", "0.1", "-e", "0.9", "-n", "9"])
+    for S_w in np.linspace(0.1, 0.9, 9):
+        member = graph.artists["S_w{:0.1f}".format(S_w)].artist
+        np.testing.assert_allclose(member.get_ydata(), scalarLoop(lambda T: parametrization.S_w2S_i_P0(T, S_w), Tn), rtol=1e-12)
+
+    graph.iso_T_F(["-s", "238", "-e", "258", "-n", "11"])
+    for T_F in np.linspace(238, 258, 11):
+        member = graph.artists["T_F{:0.2f}".format(T_F)].artist
+        reference = scalarLoop(lambda T: np.exp(parametrization.ln_p_MurphyKoop2005(T_F) - parametrization.ln_p_i_P0(T)), Tn)
+        np.testing.assert_allclose(member.get_ydata(), reference, rtol=1e-12)
+
+@pytest.fixture
+def tableBackend():
+    parametrization.setBackend("table", 150, 330)
+    yield
+    parametrization.setBackend("exact")
+
+def test_tables_within_error_bound(tableBackend):
+    T = np.concatenate([np.random.default_rng(0).uniform(150, 330, 200000), np.linspace(150, 330, 100001)])
+    for name, maxError in parametrization.tableErrors().items():
+        function = getattr(parametrization, name)
+        if parametrization._tables[name].errorKind == "absolute": # logarithms : the relative error on the pressure
+            error = np.max(np.abs(function(T) - function.exact(T)))
+        else:
+            error = np.max(np.abs(function(T) / function.exact(T) - 1))
+        assert maxError <= 1e-9
+        assert error <= 1e-9, name
+
+def test_tables_fall_back_outside_range(tableBackend):
+    for name in parametrization.tableErrors():
+        function = getattr(parametrization, name)
+        assert isinstance(function(100.0), float)
+        assert function(100.0) == function.exact(100.0)
+        assert np.isnan(function(np.nan))
+        with np.errstate(invalid="ignore"): # the exact polynomials give inf - inf at infinity
+            values = function(np.array([[200.0, np.nan], [np.inf, 400.0]]))
+        assert values.shape == (2, 2)
+        assert np.isclose(values[0, 0], function.exact(200.0), rtol=1e-9, atol=0)
+        assert np.isnan(values[0, 1])
+        assert values[1, 1] == function.exact(400.0)
+
+def test_tables_evaluate_floats_exactly(tableBackend):
+    for name in parametrization.tableErrors():
+        function = getattr(parametrization, name)
+        assert function(250.0) == function.exact(250.0)
+        assert np.isclose(function(np.array(250.0)), function.exact(250.0), rtol=0, atol=1e-9) # arrays, even 0-d, use the table
+
+def test_table_range_is_validated():
+    with pytest.raises(ValueError):
+        parametrization.setBackend("table", 300, 200)
+    assert parametrization.backend == "exact"
@@ -0,0 +1,34 @@
+import matplotlib
+matplotlib.use("Agg")
+
+import numpy as np
+import pytest
+
+import graphs
+import sampling
+
+def interpolationError(T, functions):
+    '''
+    Largest relative error of linear interpolation on T, checked on 50 points inside every interval
+    '''
+    fine = np.linspace(T[:-1], T[1:], 51, axis=1)[:, 1:-1].ravel()
+    return max(np.max(np.abs(np.interp(fine, T, function(T)) / function(fine) - 1)) for function in functions)
+
+@pytest.mark.parametrize("tol", [1e-2, 1e-3, 1e-4])
+def test_diagram_grid_within_tolerance(tol):
+    T = sampling.diagramGrid(235, 293, tol)
+    assert T[0] == 235 and T[-1] == 293
+    assert np.all(np.diff(T) > 0)
+    assert interpolationError(T, sampling.diagramShapes()) <= 1.1 * tol # the midpoint is about the worst point
+
+def test_descending_range_is_refined():
+    np.testing.assert_array_equal(sampling.refine(sampling.diagramShapes(), 293, 235), sampling.refine(sampling.diagramShapes(), 235, 293))
+    assert sampling.diagramGrid(293, 235) is sampling.diagramGrid(235, 293)
+
+@pytest.mark.parametrize("args", [["293", "235"], ["293", "235", "--adaptive"]])
+def test_trange_is_ascending(args):
+    graph = graphs.S_iTGraph()
+    graph.Trange(args)
+    assert graph.Tn[0] == 235 and graph.Tn[-1] == 293
+    assert np.all(np.diff(graph.Tn) > 0)
+    matplotlib.pyplot.close(graph.fig)
@@ -0,0 +1,150 @@
+import asyncio
+import json
+import os
+import socket
+import struct
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+import parametrization
+import service
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="Unix sockets")
+
+def serving(test):
+    '''
+    Runs test(address, server) in worker threads while the server runs in the event loop of the test
+    '''
+    async def main():
+        address = os.path.join(tempfile.mkdtemp(), "service.sock") # short enough for a socket path
+        server = service.Server(address)
+        ready = asyncio.Event()
+        serving = asyncio.create_task(server.serve(ready))
+        await ready.wait()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, test, address, server)
+        finally:
+            serving.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await serving
+            assert not os.path.exists(address)
+    return asyncio.run(main())
+
+def request(function, *arguments, requestId=1):
+    arguments = [np.asarray(argument, dtype="<f8") for argument in arguments]
+    return service._frame({"id": requestId, "function": function, "shapes": [list(argument.shape) for argument in arguments]}, b"".join(argument.tobytes() for argument in arguments))
+
+def response(sock):
+    def receive(size):
+        data = b""
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            assert chunk, "connection closed"
+            data += chunk
+        return data
+    size, = struct.unpack("<I", receive(4))
+    header = json.loads(receive(size))
+    if "shape" in header:
+        header["result"] = np.frombuffer(receive(8 * int(np.prod(header["shape"]))), dtype="<f8").reshape(header["shape"])
+    return header
+
+def test_results_match_parametrization():
+    T = np.linspace(220, 290, 30)
+    S_w = np.array([[0.5], [0.9]])
+
+    def test(address, server):
+        with service.Client(address) as client:
+            np.testing.assert_array_equal(client.S_w2S_i_P0(T, S_w), parametrization.S_w2S_i_P0(T, S_w)) # broadcast
+            np.testing.assert_array_equal(client.S_w_changeTemp(T, 296.0, 0.4), parametrization.S_w_changeTemp(T, 296.0, 0.4))
+            assert client.ln_p_i_P0(250.0) == parametrization.ln_p_i_P0(250.0)
+            assert client.call("T_F", np.empty((0, 3))).shape == (0, 3)
+    serving(test)
+
+def test_concurrent_clients_are_batched():
+    T = np.linspace(220, 290, 1000)
+
+    def call(address, S_w):
+        with service.Client(address) as client:
+            return [client.S_w2S_i_P0(T, S_w) for _ in range(20)]
+
+    def test(address, server):
+        values = np.linspace(0.1, 0.9, 8)
+        with ThreadPoolExecutor(len(values)) as executor:
+            results = list(executor.map(call, [address] * len(values), values))
+        for S_w, calls in zip(values, results):
+            for result in calls:
+                np.testing.assert_array_equal(result, parametrization.S_w2S_i_P0(T, S_w))
+        with service.Client(address) as client:
+            return client.stats()
+
+    stats = serving(test)
+    assert stats["requests"] == 160
+    assert stats["values"] == 160 * 1000
+
+def test_requests_of_concurrent_connections_are_evaluated_together():
+    def test(address, server):
+        sockets = [socket.socket(socket.AF_UNIX) for _ in range(8)]
+        for sock in sockets: # connected and waiting for requests
+            sock.connect(address)
+            sock.sendall(service._frame({"id": 0, "function": "_stats", "shapes": []}))
+            response(sock)
+
+        paused, resume = threading.Event(), threading.Event()
+        server.batcher.loop.call_soon_threadsafe(lambda: paused.set() or resume.wait()) # every request arrives in one iteration
+        paused.wait()
+        for i, sock in enumerate(sockets):
+            sock.sendall(request("S_w2S_i_P0", [240.0 + i, 250.0], 0.5, requestId=i))
+        resume.set()
+
+        for i, sock in enumerate(sockets):
+            header = response(sock)
+            assert header["id"] == i
+            np.testing.assert_array_equal(header["result"], parametrization.S_w2S_i_P0(np.array([240.0 + i, 250.0]), 0.5))
+            sock.close()
+        return server.batcher.batches
+
+    assert serving(test) == 1
+
+def test_requests_read_together_are_evaluated_together():
+    def test(address, server):
+        with socket.socket(socket.AF_UNIX) as sock:
+            sock.connect(address)
+            sock.sendall(b"".join(request("ln_p_i_P0", [T], requestId=T) for T in range(230, 240)))
+            responses = [response(sock) for _ in range(10)]
+        for header, T in zip(responses, range(230, 240)):
+            assert header["id"] == T
+            np.testing.assert_array_equal(header["result"], parametrization.ln_p_i_P0(np.array([float(T)])))
+        return server.batcher.batches
+
+    assert serving(test) == 1
+
+@pytest.mark.parametrize("frame, error", [
+    (request("nope", [1.0]), "Unknown function"),
+    (request("S_w2S_i_P0", [1.0]), "takes 2 arguments"),
+    (request("S_w2S_i_P0", [1.0, 2.0], [1.0, 2.0, 3.0]), "shape"),
+])
+def test_bad_requests_get_errors(frame, error):
+    def test(address, server):
+        with socket.socket(socket.AF_UNIX) as sock:
+            sock.connect(address)
+            sock.sendall(frame + request("T_F", [250.0], requestId=2))
+            header = response(sock)
+            assert header["id"] == 1 and error in header["error"]
+            assert response(sock)["id"] == 2 # the connection goes on
+    serving(test)
+
+@pytest.mark.parametrize("header", [b"{not json", b'{"shapes": [[-1]]}', b'{"shapes": 3}'])
+def test_malformed_requests_get_errors_and_the_server_goes_on(header):
+    def test(address, server):
+        with socket.socket(socket.AF_UNIX) as sock:
+            sock.connect(address)
+            sock.sendall(struct.pack("<I", len(header)) + header)
+            reply = response(sock)
+            assert reply["id"] is None and "Malformed request" in reply["error"]
+        with service.Client(address) as client:
+            assert client.T_F(250.0) == parametrization.T_F(250.0)
+    serving(test)
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+import parametrization
+import simulation
+
+def trajectory(seed, steps=400):
+    '''
+    Random walk through condensation, homogeneous freezing, melting and sublimation
+    '''
+    rng = np.random.default_rng(seed)
+    T = np.concatenate([np.linspace(260, 228, steps // 4), np.linspace(228, 280, steps // 4), np.linspace(280, 226, steps // 2)])
+    S_i = 1.25 + 0.3 * np.sin(np.linspace(0, 6 * np.pi, T.size) + rng.uniform(0, 2 * np.pi)) + rng.normal(0, 0.05, T.size)
+    return T + rng.normal(0, 0.5, T.size), S_i
+
+def referenceStates(radii, T, S_i, T_hom=235.0, T_melt=273.15):
+    '''
+    The model of simulation, pore by pore and step by step : states and active pores of every step
+    '''
+    ice = [False] * len(radii)
+    states, active = [], []
+    for T_step, S_i_step in zip(T, S_i):
+        S_w = float(parametrization.S_i2S_w_P0(T_step, S_i_step))
+        rFill = np.inf if S_w >= 1 else -float(parametrization.r_m(T_step, S_w))
+        rCrit = float(parametrization.criticalOutOfPoresGrowthRadius(T_step, S_i_step)) if S_i_step > 1 else np.inf
+        reset = T_step > T_melt or not S_i_step >= 1
+
+        step, stepActive = [], []
+        for pore, r in enumerate(radii):
+            filled = r <= rFill
+            if reset:
+                ice[pore] = False
+                filled = filled and T_step > T_hom
+            elif T_step <= T_hom and filled:
+                ice[pore] = True
+            step.append(simulation.ICE if ice[pore] else simulation.LIQUID if filled else simulation.EMPTY)
+            stepActive.append(ice[pore] and r >= rCrit)
+        states.append(step)
+        active.append(stepActive)
+    return np.array(states), np.array(active)
+
+@pytest.mark.parametrize("seed", [0, 1, 2, 3])
+def test_states_match_per_pore_loop(seed):
+    ensemble = simulation.PoreEnsemble.lognormal(4e-9, 0.5, 150, seed=seed)
+    radii = ensemble.radii[np.argsort(ensemble.order)] # input order
+    T, S_i = trajectory(seed)
+    result = simulation.simulate(ensemble, T, S_i=S_i)
+    states, active = referenceStates(radii, T, S_i)
+
+    for step in range(T.size):
+        np.testing.assert_array_equal(result.states(step), states[step])
+    np.testing.assert_array_equal(result.activeCount, active.sum(axis=1))
+    np.testing.assert_allclose(result.ice, (states == simulation.ICE).mean(axis=1))
+    np.testing.assert_allclose(result.liquid, (states == simulation.LIQUID).mean(axis=1), atol=1e-12)
+
+    # the trajectory goes through every rule
+    assert {simulation.EMPTY, simulation.LIQUID, simulation.ICE} <= set(np.unique(states))
+    iceCount = (states == simulation.ICE).sum(axis=1)
+    assert np.any((iceCount[:-1] > 0) & (iceCount[1:] == 0)) # melting or sublimation resets the ice
+    assert np.any(iceCount[:-1] < iceCount[1:]) # and pores freeze again after a reset
+    assert active.any()
+
+def test_weights_give_weighted_fractions():
+    rng = np.random.default_rng(5)
+    radii = 4e-9 * np.exp(0.5 * rng.standard_normal(100))
+    weights = rng.uniform(0.1, 2, 100)
+    T, S_i = trajectory(5)
+    result = simulation.simulate(simulation.PoreEnsemble(radii, weights), T, S_i=S_i)
+    states, active = referenceStates(radii, T, S_i)
+    np.testing.assert_allclose(result.ice, (states == simulation.ICE) @ weights / weights.sum())
+
+def test_worker_processes_match_single_process():
+    ensemble = simulation.PoreEnsemble.lognormal(4e-9, 0.5, 1000, seed=7)
+    T, S_i = trajectory(7, steps=2000)
+    single = simulation.simulate(ensemble, T, S_i=S_i, jobs=1)
+    pooled = simulation.simulate(ensemble, T, S_i=S_i, jobs=2, chunkSize=300)
+    for name in ("fillCount", "iceCount", "activeCount"):
+        np.testing.assert_array_equal(getattr(pooled, name), getattr(single, name))
@@ -0,0 +1,125 @@
+import io
+import json
+
+import matplotlib
+matplotlib.use("Agg")
+
+import numpy as np
+import pytest
+
+import ingest
+import snapshot
+import utils
+
+class MemoryLogger:
+    def log(self, message, level=5):
+        pass
+
+commands = [
+    "graph S_w1",
+    "graph iso_S_w -n 6",
+    "graph S_i 1.4 -c red",
+    "graph vline 250",
+    "graph field r_crit -n 60 -m 60",
+    "graph field cos_theta_iw -k heatmap -n 30 -m 30",
+    "graph trajectory {log} -n 500",
+    "graph pcf {path} -n 2000",
+    "hide S_w0.4",
+    "width S_i1.40 3",
+]
+
+@pytest.fixture
+def cli(tmp_path):
+    T = np.linspace(238, 268, 3000)
+    np.savez(tmp_path / "path.npz", T=T, S_i=1.25 + 0.3 * np.sin(np.linspace(0, 20, T.size)))
+    with open(tmp_path / "log.csv", "w") as f:
+        f.write("T,RH\n" + "".join("{},{}\n".format(T, RH) for T, RH in zip(T, 60 + 30 * np.sin(np.linspace(0, 9, T.size)))))
+
+    cli = utils.CLI(MemoryLogger(), interactive=False)
+    for command in commands:
+        assert cli.execute(command.format(log=tmp_path / "log.csv", path=tmp_path / "path.npz")), command
+    yield cli
+    matplotlib.pyplot.close(cli.S_iTGraph.fig)
+
+def render(graph):
+    buffer = io.BytesIO()
+    graph.savefig(buffer, format="rgba", dpi=graph.fig.dpi)
+    width, height = graph.fig.canvas.get_width_height(physical=True)
+    return np.frombuffer(buffer.getvalue(), dtype=np.uint8).reshape(height, width, 4)
+
+def artistData(entry):
+    artist = entry.artist
+    if entry.kind == "scatter":
+        return [artist.get_offsets()]
+    if entry.kind == "contour":
+        return [segment for level in artist.allsegs for segment in level] + [artist.levels]
+    if entry.kind == "image":
+        return [artist.get_array().filled(np.nan), artist.get_extent()]
+    if isinstance(artist, ingest.TrajectoryLine): # stored as the points drawn for the whole run
+        return list(ingest.decimate(artist.trajectory, (-np.inf, np.inf), (-np.inf, np.inf), artist.target))
+    return [artist.get_xdata(), artist.get_ydata()]
+
+def labelData(label):
+    if label is None:
+        return None
+    if hasattr(label, "texts"): # contour labels
+        return [(text.get_text(), text.get_position()) for text in label.texts]
+    if isinstance(label, matplotlib.text.Text):
+        return (label.get_text(), label.get_position())
+    return (label.get_xdata(), label.get_ydata())
+
+def test_round_trip(cli, tmp_path):
+    graph = cli.S_iTGraph
+    assert cli.execute("save {}".format(tmp_path / "snapshot"))
+    kinds = {entry.kind for entry in graph.artists}
+    assert kinds == {"line", "member", "scatter", "contour", "image"}
+    assert all(graph.artists[name].label is not None for name in ("S_w1", "S_w0.5", "S_i1.40", "V2.5e+02", "r_crit_contour")) # placed by save
+
+    loaded = utils.CLI(MemoryLogger(), interactive=False)
+    try:
+        assert loaded.execute("load {}".format(tmp_path / "snapshot.npz"))
+        copy = loaded.S_iTGraph
+        assert copy.artists.names() == graph.artists.names()
+        np.testing.assert_array_equal(copy.Tn, graph.Tn)
+        assert copy.ax.get_xlim() == graph.ax.get_xlim() and copy.ax.get_ylim() == graph.ax.get_ylim()
+
+        for entry in graph.artists:
+            other = copy.artists[entry.name]
+            assert (other.kind, other.family, other.tags) == (entry.kind, entry.family, entry.tags)
+            for values, otherValues in zip(artistData(entry), artistData(other), strict=True):
+                np.testing.assert_array_equal(np.asarray(otherValues, dtype=float), np.asarray(values, dtype=float))
+            assert other.artist.get_visible() == entry.artist.get_visible()
+            label, otherLabel = labelData(entry.label), labelData(other.label)
+            assert (label is None) == (otherLabel is None)
+            if label is not None:
+                np.testing.assert_equal(otherLabel, label)
+
+        difference = np.abs(render(copy).astype(int) - render(graph)).max(axis=2)
+        assert difference.max() <= 8
+        assert np.count_nonzero(difference) <= 0.001 * difference.size
+    finally:
+        matplotlib.pyplot.close(loaded.S_iTGraph.fig)
+
+def test_packed_references_tile_the_buffer(cli, tmp_path):
+    snapshot.save(cli.S_iTGraph, tmp_path / "snapshot.npz")
+    with np.load(tmp_path / "snapshot.npz") as archive:
+        data = archive["data"]
+        meta = json.loads(archive["meta"].tobytes().decode())
+    assert data.dtype == np.float64
+
+    references = []
+    def collect(value):
+        if isinstance(value, dict):
+            for item in value.values():
+                collect(item)
+        elif isinstance(value, list):
+            if len(value) == 3 and isinstance(value[0], int) and isinstance(value[1], list) and isinstance(value[2], str) and value[2][1:2] in "fiub":
+                references.append(value)
+            else:
+                for item in value:
+                    collect(item)
+    collect(meta)
+
+    extents = sorted((offset, offset + int(np.prod(shape))) for offset, shape, dtype in references)
+    assert extents[0][0] == 0 and extents[-1][1] == data.size
+    assert all(stop == start for (_, stop), (start, _) in zip(extents, extents[1:])) # contiguous, no overlap
@@ -0,0 +1,18 @@
+import statistics
+import subprocess
+import sys
+
+import bench
+
+def test_startup_within_budget():
+    assert statistics.median(bench.startupTimes(repeat=5)) <= 0.25
+
+def test_startup_commands_do_not_import_heavy_modules():
+    script = ("import os, sys, utils\n"
+              "CLI = utils.CLI(utils.Logger(os.devnull), interactive=False)\n"
+              "for command in {!r}.splitlines():\n"
+              "    assert CLI.execute(command), command\n"
+              "CLI.logger.close()\n"
+              "print(' '.join(name for name in ('matplotlib', 'numpy', 'labellines') if name in sys.modules))\n").format(bench.startupScript)
+    imported = subprocess.run([sys.executable, "-c", script], cwd=bench.here, capture_output=True, text=True, check=True).stdout.splitlines()[-1]
+    assert imported == ""
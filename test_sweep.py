@@ -0,0 +1,27 @@
+import matplotlib
+matplotlib.use("Agg")
+
+import sweep
+
+def test_failing_figure_is_reported(tmp_path):
+    index, output, success, detail = sweep.renderFigure(3, ["graph S_i 1.2"], str(tmp_path / "figure.xyz"))
+    assert (index, success) == (3, False)
+    assert detail.startswith("ValueError")
+
+def test_failing_command_is_reported(tmp_path):
+    index, output, success, detail = sweep.renderFigure(0, ["graph S_i"], str(tmp_path / "figure.png"))
+    assert not success
+    assert detail.startswith("graph S_i")
+
+def test_figure_is_written(tmp_path):
+    index, output, success, detail = sweep.renderFigure(0, ["graph S_i 1.2"], str(tmp_path / "figure.png"))
+    assert success
+    assert (tmp_path / "figure.png").exists()
+
+def test_sweep_runs_in_fresh_worker_processes(tmp_path):
+    figure = matplotlib.pyplot.figure() # workers do not inherit the figures of the calling process
+    results = sweep.run(["graph S_i {x}"], [("x", [1.2, 1.4])], str(tmp_path / "f{x}.png"), jobs=2, progress=lambda message: None)
+    assert [success for values, path, success, detail in results] == [True, True]
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["f1.2.png", "f1.4.png"]
+    assert matplotlib.pyplot.fignum_exists(figure.number)
+    matplotlib.pyplot.close(figure)
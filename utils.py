@@ -1,37 +1,307 @@
 from datetime import datetime
-import pytz
 import argparse
-import matplotlib.pyplot as plt
-from matplotlib.widgets import Cursor
-import re
-
-import graphs
+import atexit
+import json
+import os
+import queue
+import shlex
+import sys
+import threading
+import time
+
+import instrumentation
+
+# matplotlib, labellines, numpy and graphs are imported on first use (see CLI.S_iTGraph), so that commands
+# that do not draw anything (help, c2k, k2c...) start without paying their import cost
+
+def parseArgs(parser, args):
+    '''
+    Namespace of the arguments of a command, or None when the parser only printed its help (-h). Invalid
+    arguments raise SystemExit, which CLI.execute reports as a failed command instead of exiting the program.
+    '''
+    try:
+        return parser.parse_args(args)
+    except SystemExit as e:
+        if e.code:
+            raise
+        return None
 
 class Logger:
-    def __init__(self, logFile="log.dat", logLevelConsole: int=4, timeZone :str="Europe/Paris") -> None:
-        self.f = open(logFile, 'a+')
+    '''
+    Writes log records from a background thread : log() only takes a timestamp and queues the record, the
+    writer thread formats and writes records in batches, flushes after each batch and rotates the file.
+
+    logFormat : "text" ([ddmmYYYY HH:MM:SS][level] message) or "jsonl" (one JSON object per line, see readRecords)
+    maxBytes : rotate when the file grows beyond this size (None : never)
+    rotateEvery : rotate after this many seconds (None : never)
+    backupCount : number of rotated files kept (logFile.1 is the most recent)
+    '''
+    def __init__(self, logFile="log.dat", logLevelConsole: int=4, timeZone :str="Europe/Paris", logFormat="text", maxBytes=None, rotateEvery=None, backupCount=5, batchSize=512, flushInterval=0.5) -> None:
+        import pytz
+
+        if logFormat not in ("text", "jsonl"):
+            raise ValueError("Unknown log format : {}".format(logFormat))
+
+        self.logFile = logFile
+        self.f = open(logFile, 'a')
         self.logLevelConsole = logLevelConsole
         self.tz = pytz.timezone(timeZone)
+        self.logFormat = logFormat
+        self.maxBytes = maxBytes
+        self.rotateEvery = rotateEvery
+        self.backupCount = backupCount
+        self.batchSize = batchSize
+        self.flushInterval = flushInterval
+
+        self._openedAt = time.time()
+        self._second = None
+        self._stamp = None
+        self._error = None # last write error reported on stderr
+
+        self._queue = queue.SimpleQueue()
+        self._closed = False
+        self._writer = threading.Thread(target=self._write, name="Logger", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
 
     def log(self, message : str, level: int=5):
-        messageToWrite = "[{}][{}] {}".format(datetime.now(self.tz).strftime("%d%m%Y %H:%M:%S"), level, message)
-        self.f.write(messageToWrite + "\n")
+        self._queue.put((time.time(), level, message))
         if level >= self.logLevelConsole:
             print(message)
 
+    def flush(self):
+        '''
+        Blocks until every record logged so far is written
+        '''
+        if self._closed:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join()
+        self.f.close()
+        atexit.unregister(self.close)
+
+    def _timestamp(self, t):
+        # strftime through pytz only once per second
+        second = int(t)
+        if second != self._second:
+            self._second = second
+            self._stamp = datetime.fromtimestamp(second, self.tz).strftime("%d%m%Y %H:%M:%S")
+        return self._stamp
+
+    def _format(self, t, level, message):
+        if self.logFormat == "jsonl":
+            return json.dumps({"t": round(t, 6), "time": self._timestamp(t), "level": level, "message": message}) + "\n"
+        return "[{}][{}] {}\n".format(self._timestamp(t), level, message)
+
+    def _write(self):
+        running = True
+        while running:
+            try:
+                batch = [self._queue.get(timeout=self.flushInterval)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batchSize:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            lines = []
+            events = []
+            for record in batch:
+                if record is None:
+                    running = False
+                elif isinstance(record, threading.Event):
+                    events.append(record)
+                else:
+                    lines.append(self._format(*record))
+
+            try:
+                if self.f.closed: # a previous rotation could not reopen the file
+                    self.f = open(self.logFile, 'a')
+                if lines:
+                    self.f.write("".join(lines))
+                self.f.flush()
+                self._rotateIfNeeded()
+                self._error = None
+            except OSError as e: # disk full, missing directory... : this batch is lost, the writer goes on
+                self._reportError(e)
+            finally:
+                for event in events:
+                    event.set()
+
+    def _reportError(self, error):
+        message = "{} : {}".format(type(error).__name__, error)
+        if message != self._error: # once until the error changes or a batch is written again
+            self._error = message
+            print("Logger : could not write {} : {}".format(self.logFile, message), file=sys.stderr)
+
+    def _rotateIfNeeded(self):
+        now = time.time()
+        bySize = self.maxBytes is not None and self.f.tell() >= self.maxBytes
+        byTime = self.rotateEvery is not None and now - self._openedAt >= self.rotateEvery
+        if not (bySize or byTime):
+            return
+
+        self.f.close()
+        try:
+            for i in range(self.backupCount - 1, 0, -1):
+                if os.path.exists("{}.{}".format(self.logFile, i)):
+                    os.replace("{}.{}".format(self.logFile, i), "{}.{}".format(self.logFile, i + 1))
+            if self.backupCount > 0:
+                os.replace(self.logFile, "{}.1".format(self.logFile))
+            else:
+                os.remove(self.logFile)
+        finally: # keep logging to the current file when the backups cannot be renamed
+            self._openedAt = now
+            self.f = open(self.logFile, 'a')
+
+def readRecords(logFile, minLevel=None, since=None, contains=None):
+    '''
+    Yields the records {"t", "time", "level", "message"} of a "jsonl" log file, optionally filtered by
+    minimum level, epoch time and message substring
+    '''
+    with open(logFile) as f:
+        for line in f:
+            if contains is not None and contains not in line: # cheap pre-filter before parsing
+                continue
+            record = json.loads(line)
+            if minLevel is not None and record["level"] < minLevel:
+                continue
+            if since is not None and record["t"] < since:
+                continue
+            if contains is not None and contains not in record["message"]:
+                continue
+            yield record
+
 class CLI:
-    def __init__(self, logger) -> None:
+    internalMethods = ("execute", "call", "commands") # public methods that are not user commands
+
+    def __init__(self, logger, interactive=True) -> None:
         self.logger = logger
+        self.interactive = interactive
+        self._S_iTGraph = None
+        self.watchers = {}
         self.logger.log("Successfully created CommandLineInterface")
 
-        self.S_iTGraph = graphs.S_iTGraph()
+    @property
+    def S_iTGraph(self):
+        '''
+        The S_i T diagram, created with its figure on first use
+        '''
+        if self._S_iTGraph is None:
+            import matplotlib.pyplot as plt
+            import graphs
+            import parametrization
+
+            instrumentation.instrumentModule(parametrization, exclude=("check_float", "tabulated", "setBackend", "tableErrors", "clearTermsCache"))
+
+            self._S_iTGraph = graphs.S_iTGraph()
+
+            #cursor = Cursor(self.S_iTGraph.fig, useblit=True, color='black', linewidth=1)
+
+            if self.interactive:
+                plt.ion()
+                plt.show()
+            else: # figures are only drawn when exported
+                self._S_iTGraph.deferred = True
+
+        return self._S_iTGraph
+
+    def commands(self):
+        # looked up on the class : getattr on the instance would create the graph through the S_iTGraph property
+        return [func for func in dir(type(self)) if callable(getattr(type(self), func)) and not func.startswith("_") and not func in self.internalMethods]
+
+    def execute(self, userInput):
+        '''
+        Runs one command line. Returns False if the command failed or does not exist, True otherwise.
+        '''
+        command = userInput.split(" ")[0]
+        args = userInput.split(" ")[1:]
+
+        if userInput == "help" or userInput == "h" or userInput == "-h":
+            print("Available commands : ")
+            for method in self.commands():
+                print("\t{}".format(method))
+        elif command in self.commands():
+            return self.call(command, args)
+        else:
+            self.logger.log("User echo : " + userInput)
+            return False
+
+        return True
+
+    def call(self, command, args):
+        '''
+        Runs command with a list of arguments, for callers that already hold them apart (paths with spaces).
+        Returns False if the command failed, True otherwise.
+        '''
+        try:
+            with instrumentation.timer("command." + command):
+                getattr(self, command)(args)
+        except SystemExit: # invalid arguments, the parser already printed why
+            self.logger.log("Invalid arguments : " + " ".join([command] + list(args)), 7)
+            return False
+        except Exception as e:
+            self.logger.log(str(e), 7)
+            return False
+        return True
+
+    def export(self, args):
+        parser = argparse.ArgumentParser(prog="export", exit_on_error=False, description="Write the figure to a file, format given by the extension (png, svg, pdf...)")
+        parser.add_argument("path", type=str, help="Output file")
+        parser.add_argument("-d", "--dpi", dest="dpi", type=float, default=None, help="Resolution of raster formats (default: matplotlib's savefig.dpi)")
+
+        parsedArgs = parseArgs(parser, args)
+        if parsedArgs is None:
+            return
+
+        self.S_iTGraph.savefig(parsedArgs.path, dpi=parsedArgs.dpi)
+        self.logger.log("Figure written to {}".format(parsedArgs.path))
+
+    def save(self, args):
+        parser = argparse.ArgumentParser(prog="save", exit_on_error=False, description="Save the diagram (curves, styles, visibility, labels, view) to a .npz snapshot, reopened with load")
+        parser.add_argument("path", type=str, help="Snapshot file (.npz)")
+
+        parsedArgs = parseArgs(parser, args)
+        if parsedArgs is None:
+            return
+
+        import snapshot
+
+        path = parsedArgs.path if parsedArgs.path.endswith(".npz") else parsedArgs.path + ".npz"
+        snapshot.save(self.S_iTGraph, path)
+        self.logger.log("Diagram saved to {}".format(path))
+
+    def load(self, args):
+        parser = argparse.ArgumentParser(prog="load", exit_on_error=False, description="Replace the diagram with a snapshot written by save, without recomputing it")
+        parser.add_argument("path", type=str, help="Snapshot file (.npz)")
+
+        parsedArgs = parseArgs(parser, args)
+        if parsedArgs is None:
+            return
 
-        #cursor = Cursor(self.S_iTGraph.fig, useblit=True, color='black', linewidth=1)
+        import snapshot
 
-        plt.ion()
-        plt.show()
+        for watcher in self.watchers.values(): # their artists are replaced
+            watcher.stop()
+        self.watchers.clear()
+
+        snapshot.load(self.S_iTGraph, parsedArgs.path)
+        self.S_iTGraph.refresh()
+        self.logger.log("Diagram loaded from {}".format(parsedArgs.path))
 
     def graph(self, args):
+        import graphs
+
         if args[0] == "-h":
             nameChoices = [func for func in dir(self.S_iTGraph) if callable(getattr(self.S_iTGraph, func)) and not func.startswith("__") and not func in dir(graphs.Graph)] # choices are not-default class methods, and not inherited methods
 
@@ -40,100 +310,255 @@ class CLI:
             return
 
         graphFunction = getattr(self.S_iTGraph, args[0])
-        graphFunction(args[1:])
+        self.S_iTGraph.defaultTags = {args[0]}
+        try:
+            with instrumentation.timer("graph." + args[0]):
+                graphFunction(args[1:])
+        finally:
+            self.S_iTGraph.defaultTags = set()
 
         self.S_iTGraph.refresh()
 
     def delete(self, args):
-        parser = argparse.ArgumentParser(prog="delete", exit_on_error=False, description="Delete lines from the graph. RegularExpressions can be used")
+        parser = argparse.ArgumentParser(prog="delete", exit_on_error=False, description="Delete lines from the graph. RegularExpressions can be used, as well as *, family:NAME, tag:NAME and glob:PATTERN")
         parser.add_argument("expression", action="store", type=str, help="RegularExpression to math the lines to delete")
 
-        parsedArgs = parser.parse_args(args)
+        parsedArgs = parseArgs(parser, args)
+        if parsedArgs is None:
+            return
 
-        parsedArgs = parser.parse_args(args)
+        self.S_iTGraph.deleteMany(self.S_iTGraph.artists.match(parsedArgs.expression))
+        self.S_iTGraph.refresh()
 
-        if parsedArgs.expression == "*":
-            lineNames = list(self.S_iTGraph.lines.keys())
+    def show(self, args):
+        parser = argparse.ArgumentParser(prog="show", exit_on_error=False, description="Show hidden lines on the graph. RegularExpressions can be used, as well as *, family:NAME, tag:NAME and glob:PATTERN")
+        parser.add_argument("expression", action="store", type=str)
 
-            for lineName in lineNames:
-                self.S_iTGraph.delete(lineName)
+        parsedArgs = parseArgs(parser, args)
+        if parsedArgs is None:
+            return
 
-        else:
-            pattern = re.compile(parsedArgs.expression)
+        self.S_iTGraph.setVisible(self.S_iTGraph.artists.match(parsedArgs.expression), True)
+        self.S_iTGraph.refresh()
 
-            lineNames = list(self.S_iTGraph.lines.keys())
+    def hide(self, args):
+        parser = argparse.ArgumentParser(prog="hide", exit_on_error=False, description="Hide lines on the graph. RegularExpressions can be used, as well as *, family:NAME, tag:NAME and glob:PATTERN")
+        parser.add_argument("expression", action="store", type=str)
 
-            for lineName in lineNames:
-                if bool(pattern.match(lineName)):
-                    self.S_iTGraph.delete(lineName)
+        parsedArgs = parseArgs(parser, args)
+        if parsedArgs is None:
+            return
 
-    def show(self, args):
-        parser = argparse.ArgumentParser(prog="show", exit_on_error=False, description="Show hidden lines on the graph. RegularExpressions can be used")
+        self.S_iTGraph.setVisible(self.S_iTGraph.artists.match(parsedArgs.expression), False)
+        self.S_iTGraph.refresh()
+
+    def color(self, args):
+        import matplotlib.colors as mcolors
+
+        parser = argparse.ArgumentParser(prog="color", exit_on_error=False, description="Change the color of lines. RegularExpressions can be used, as well as *, family:NAME, tag:NAME and glob:PATTERN")
         parser.add_argument("expression", action="store", type=str)
+        parser.add_argument("color", choices=dict(mcolors.BASE_COLORS, **mcolors.CSS4_COLORS).keys(), help="New color of the lines", metavar='matplotlibColor')
 
-        parsedArgs = parser.parse_args(args)
+        parsedArgs = parseArgs(parser, args)
+        if parsedArgs is None:
+            return
 
-        parsedArgs = parser.parse_args(args)
-        if parsedArgs.expression == "*":
-            for lineName in self.S_iTGraph.lines.keys():
-                self.S_iTGraph.set_visibility(lineName, True)
-        else:
-            pattern = re.compile(parsedArgs.expression)
-            for lineName in self.S_iTGraph.lines.keys():
-                if bool(pattern.match(lineName)):
-                    self.S_iTGraph.set_visibility(lineName, True)
+        self.S_iTGraph.setColor(self.S_iTGraph.artists.match(parsedArgs.expression), parsedArgs.color)
+        self.S_iTGraph.refresh()
 
-    def hide(self, args):
-        parser = argparse.ArgumentParser(prog="hide", exit_on_error=False, description="Hide lines on the graph. RegularExpressions can be used")
+    def width(self, args):
+        parser = argparse.ArgumentParser(prog="width", exit_on_error=False, description="Change the width of lines. RegularExpressions can be used, as well as *, family:NAME, tag:NAME and glob:PATTERN")
         parser.add_argument("expression", action="store", type=str)
+        parser.add_argument("lw", type=float, help="New line width")
 
-        parsedArgs = parser.parse_args(args)
-        if parsedArgs.expression == "*":
-            for lineName in self.S_iTGraph.lines.keys():
-                self.S_iTGraph.set_visibility(lineName, False)
+        parsedArgs = parseArgs(parser, args)
+        if parsedArgs is None:
+            return
 
-        else:
-            pattern = re.compile(parsedArgs.expression)
-            for lineName in self.S_iTGraph.lines.keys():
-                if bool(pattern.match(lineName)):
-                    self.S_iTGraph.set_visibility(lineName, False)
+        self.S_iTGraph.setWidth(self.S_iTGraph.artists.match(parsedArgs.expression), parsedArgs.lw)
+        self.S_iTGraph.refresh()
+
+    def tag(self, args):
+        parser = argparse.ArgumentParser(prog="tag", exit_on_error=False, description="Tag lines, to select them later with tag:NAME")
+        parser.add_argument("expression", action="store", type=str)
+        parser.add_argument("tag", type=str, help="Tag to add")
+        parser.add_argument("-r", "--remove", dest="remove", action="store_true", help="Remove the tag instead of adding it")
+
+        parsedArgs = parseArgs(parser, args)
+        if parsedArgs is None:
+            return
+
+        for name in self.S_iTGraph.artists.match(parsedArgs.expression):
+            if parsedArgs.remove:
+                self.S_iTGraph.artists.untag(name, parsedArgs.tag)
+            else:
+                self.S_iTGraph.artists.tag(name, parsedArgs.tag)
+
+    def undo(self, args):
+        if not self.S_iTGraph.undo():
+            self.logger.log("Nothing to undo")
+            return
+        self.S_iTGraph.refresh()
 
     def list(self, args):
         parser = argparse.ArgumentParser(prog="list", exit_on_error=False)
         parser.add_argument("option", default="all", type=str, action="store", choices=["all", "hidden", "visible"], nargs='?')
 
-        try: # prevents parser from exiting main program after displaying help
-            parsedArgs = parser.parse_args(args)
-        except SystemExit:
+        parsedArgs = parseArgs(parser, args)
+        if parsedArgs is None:
             return
 
         message = ""
         if parsedArgs.option == "visible":
             message += ("S_i T Diagram :")
-            for name, line in self.S_iTGraph.lines.items():
-                if line.get_visible():
-                    message += ("\n\t{}".format(name))
+            for entry in self.S_iTGraph.artists:
+                if entry.artist.get_visible():
+                    message += ("\n\t{}".format(entry.name))
 
         elif parsedArgs.option == "hidden":
             message += ("\n\nS_i T Diagram :")
-            for name, line in self.S_iTGraph.lines.items():
-                if not line.get_visible():
-                    message += ("\n\t{}".format(name))
+            for entry in self.S_iTGraph.artists:
+                if not entry.artist.get_visible():
+                    message += ("\n\t{}".format(entry.name))
 
         elif parsedArgs.option == "all":
             message += ("\n\nS_i T Diagram :")
-            for name, line in self.S_iTGraph.lines.items():
-                message += ("\n\t[{}] {}".format("V" if line.get_visible() else " ", name))
+            for entry in self.S_iTGraph.artists:
+                message += ("\n\t[{}] {}".format("V" if entry.artist.get_visible() else " ", entry.name))
 
         self.logger.log(message)
 
+    def watch(self, args):
+        parser = argparse.ArgumentParser(prog="watch", exit_on_error=False, description="Follow a growing CSV log (with a header line) and draw the sample state live on the S_i T diagram")
+        parser.add_argument("path", nargs="?", default=None, help="Log file to follow")
+        parser.add_argument("-T", "--T-column", dest="T", default="T", help="Sample temperature column (default: %(default)s)")
+        parser.add_argument("-r", "--RH-column", dest="RH", default="RH", help="Relative humidity column (default: %(default)s)")
+        parser.add_argument("-s", "--sensor", dest="sensor", default=None, help="Column, or fixed temperature, at which RH is measured when it is not the sample temperature")
+        parser.add_argument("--celsius", dest="celsius", action="store_true", help="Temperatures are in degrees Celsius")
+        parser.add_argument("--fraction", dest="percent", action="store_false", help="RH is given between 0 and 1 instead of in percent")
+        parser.add_argument("-b", "--from-start", dest="fromStart", action="store_true", help="Read the lines already in the file too")
+        parser.add_argument("-n", "--capacity", dest="capacity", type=int, default=100000, help="Number of most recent samples drawn (default: %(default)s)")
+        parser.add_argument("-f", "--fps", dest="fps", type=float, default=20, help="Maximum redraws per second (default: %(default)s)")
+        parser.add_argument("-d", "--duration", dest="duration", type=float, default=None, help="Watch for this many seconds before returning to the prompt (needed in scripts)")
+        parser.add_argument("-c", "--color", dest="color", default="black", help="Color of the trajectory (default: %(default)s)")
+        parser.add_argument("-w", "--lw", dest="lw", type=float, default=1, help="Line width (default: %(default)s)")
+        parser.add_argument("--name", dest="name", default=None, help="Name of the trajectory (default: live_ followed by the file name)")
+        parser.add_argument("--stop", dest="stop", default=None, help="Stop watching : a name, or * for every watch")
+
+        parsedArgs = parseArgs(parser, args)
+        if parsedArgs is None:
+            return
+
+        import live
+
+        for name, watcher in list(self.watchers.items()): # forget watches that ended (file error, artist deleted)
+            if not watcher.running:
+                if watcher.error is not None:
+                    self.logger.log("watch {} stopped : {}".format(name, watcher.error), 7)
+                del self.watchers[name]
+
+        if parsedArgs.stop is not None:
+            for name in list(self.watchers) if parsedArgs.stop == "*" else [parsedArgs.stop]:
+                if name not in self.watchers:
+                    raise NameError("No watch named {}".format(name))
+                self.watchers.pop(name).stop()
+            return
+
+        if parsedArgs.path is None:
+            self.logger.log("Watching : " + (", ".join(self.watchers) or "nothing"))
+            return
+
+        sensor = parsedArgs.sensor
+        try:
+            sensor = float(sensor)
+        except (TypeError, ValueError):
+            pass
+
+        name = parsedArgs.name or "live_" + os.path.splitext(os.path.basename(parsedArgs.path))[0]
+        if name in self.watchers:
+            self.watchers.pop(name).stop()
+
+        tail = live.Tail(parsedArgs.path, T=parsedArgs.T, RH=parsedArgs.RH, T_sensor=sensor, celsius=parsedArgs.celsius, percent=parsedArgs.percent, fromStart=parsedArgs.fromStart)
+        watcher = live.Watcher(self.S_iTGraph, tail, name, capacity=parsedArgs.capacity, fps=parsedArgs.fps, color=parsedArgs.color, lw=parsedArgs.lw)
+        self.watchers[name] = watcher
+
+        if parsedArgs.duration is not None:
+            watcher.start(timer=False)
+            watcher.run(parsedArgs.duration)
+            watcher.stop()
+            del self.watchers[name]
+            if watcher.error is not None:
+                raise watcher.error
+        elif not self.interactive:
+            del self.watchers[name]
+            raise ValueError("watch needs --duration outside the interactive prompt")
+        else:
+            watcher.start()
+            self.logger.log("Watching {} as {}, stop with watch --stop {}".format(parsedArgs.path, name, name))
+
+    def sweep(self, args):
+        import sweep
+
+        parser = sweep.buildParser()
+        parsedArgs = parseArgs(parser, shlex.split(" ".join(args))) # templates are quoted command lines
+        if parsedArgs is None:
+            return
+
+        results = sweep.run(parsedArgs.templates, parsedArgs.parameters, parsedArgs.output, setup=sweep.setupCommands(parsedArgs.setup), jobs=parsedArgs.jobs, progress=self.logger.log)
+        failures = [path for values, path, success, detail in results if not success]
+        if failures:
+            raise RuntimeError("{} figures failed : {}".format(len(failures), ", ".join(failures)))
+
+    def profile(self, args):
+        parser = argparse.ArgumentParser(prog="profile", exit_on_error=False, description="Run a command under cProfile and print its hotspots, e.g. profile graph iso_T_F -n 200")
+        parser.add_argument("-n", "--top", dest="top", type=int, default=20, help="Number of functions shown (default: %(default)s)")
+        parser.add_argument("-s", "--sort", dest="sort", choices=["cumulative", "tottime", "ncalls"], default="cumulative", help="Sort order (default: %(default)s)")
+        parser.add_argument("command", nargs=argparse.REMAINDER, help="Command to profile, with its arguments")
+
+        parsedArgs = parseArgs(parser, args)
+        if parsedArgs is None:
+            return
+
+        if not parsedArgs.command:
+            self.logger.log("usage: profile [-n TOP] [-s SORT] command ...")
+            return
+
+        import cProfile
+        import io
+        import pstats
+
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            success = self.execute(" ".join(parsedArgs.command))
+        finally:
+            profiler.disable()
+        elapsed = time.perf_counter() - start
+
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats(parsedArgs.sort).print_stats(parsedArgs.top)
+        self.logger.log("{} in {:0.3f}s{}\n{}".format(" ".join(parsedArgs.command), elapsed, "" if success else " (failed)", stream.getvalue()))
+
+    def stats(self, args):
+        parser = argparse.ArgumentParser(prog="stats", exit_on_error=False, description="Print the call counts and times accumulated since start (commands, graph commands, parametrization calls, labels, refresh)")
+        parser.add_argument("prefix", nargs="?", default="", help="Only show names starting with this prefix, e.g. parametrization, labels, graph, command")
+        parser.add_argument("-r", "--reset", dest="reset", action="store_true", help="Reset the counters after printing them")
+
+        parsedArgs = parseArgs(parser, args)
+        if parsedArgs is None:
+            return
+
+        self.logger.log(instrumentation.stats.report(parsedArgs.prefix))
+        if parsedArgs.reset:
+            instrumentation.stats.reset()
+
     def c2k(self, args):
         parser = argparse.ArgumentParser(prog="c2k", description="Converts Celcius to Kelvin", exit_on_error=False)
         parser.add_argument("celcius", type=float, help="Celcius temperature to convert")
 
-        try: # prevents parser from exiting main program after displaying help
-            parsedArgs = parser.parse_args(args)
-        except SystemExit:
+        parsedArgs = parseArgs(parser, args)
+        if parsedArgs is None:
             return
 
         self.logger.log(str(parsedArgs.celcius + 273.15))
@@ -142,9 +567,8 @@ class CLI:
         parser = argparse.ArgumentParser(prog="k2c", description="Converts Kelvin to Celcius", exit_on_error=False)
         parser.add_argument("kelvin", type=float, help="Kelvin temperature to convert")
 
-        try: # prevents parser from exiting main program after displaying help
-            parsedArgs = parser.parse_args(args)
-        except SystemExit:
+        parsedArgs = parseArgs(parser, args)
+        if parsedArgs is None:
             return
 
         self.logger.log(str(parsedArgs.kelvin - 273.15))